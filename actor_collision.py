@@ -0,0 +1,129 @@
+# -------------------------------------------------------------------- #
+# actor_collision.py
+#   finds which actors (the player, rings, enemies, projectiles...) touch
+#   each other, once per physics step. A sweep and prune broadphase keeps
+#   the actors sorted by the left edge of their hitbox, which barely
+#   changes from one step to the next, so re-sorting is close to free and
+#   only actors overlapping along x are ever paired up. Those pairs are
+#   then checked with their hitboxes, then circles, and masks last.
+#   Only actors listening for others (the player, projectiles...) look,
+#   and only through the collision groups they listen for, so a thousand
+#   rings cost little more than sorting them.
+#
+#   Every actor touching others gets them all in one on_touch() call.
+#
+#   world = ActorCollisions()
+#   player.add(world)
+#   world.step()
+# -------------------------------------------------------------------- #
+
+# General imports:
+from bisect import bisect_left, bisect_right
+
+# Game library imports:
+import pygame
+
+# Local imports:
+from constants import *
+
+
+def hitbox(actor):
+    """ The rect an actor collides with: its hitbox if it has one, its rect otherwise. """
+    return getattr(actor, 'hitbox', None) or actor.rect
+
+
+def circle_touches(center, radius, rect):
+    # Nearest point of the rect to the circle's center
+    x = min(max(center[0], rect.left), rect.right)
+    y = min(max(center[1], rect.top), rect.bottom)
+    return (x - center[0]) ** 2 + (y - center[1]) ** 2 <= radius * radius
+
+
+def touching(a, a_box, b, b_box):
+    """ Narrowphase, for actors whose hitboxes overlap. Actors with a radius are circles around
+        their hitbox's center, actors with a mask (like pygame.sprite.collide_mask) are checked pixel by pixel. """
+    a_radius, b_radius = getattr(a, 'radius', None), getattr(b, 'radius', None)
+    if a_radius and b_radius:
+        dx, dy = a_box.centerx - b_box.centerx, a_box.centery - b_box.centery
+        if dx * dx + dy * dy > (a_radius + b_radius) ** 2:
+            return False
+    elif a_radius:
+        if not circle_touches(a_box.center, a_radius, b_box):
+            return False
+    elif b_radius:
+        if not circle_touches(b_box.center, b_radius, a_box):
+            return False
+
+    if getattr(a, 'mask', None) is not None and getattr(b, 'mask', None) is not None:
+        return pygame.sprite.collide_mask(a, b) is not None
+    return True
+
+
+class ActorCollisions(pygame.sprite.Group):
+    """ A sprite group of actors that can touch each other.
+
+        Actors have a collision_group, one of the COLLIDE_ flags, and collides_with, the flags of
+        the groups they want to hear about: an actor is told about the ones it touches in those groups,
+        with on_touch(others) once per step. Sprites are taken out of it when they're killed, like
+        with any other group. """
+
+    def __init__(self, *sprites):
+        # Actors in the order of the left edge of their hitbox, as of the last step
+        self.order = []
+        super().__init__(*sprites)
+
+    def add_internal(self, sprite, layer=None):
+        super().add_internal(sprite)
+        self.order.append(sprite)
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        self.order.remove(sprite)
+
+    def find_contacts(self):
+        """ Return {actor: [actors it touches, in the groups it collides with]}. """
+        # Keep the actors sorted by the left edge of their hitbox. The order left by the last step
+        # is nearly sorted already, which Python's sort gets through in about linear time.
+        boxes = dict((actor, hitbox(actor)) for actor in self.order)
+        self.order.sort(key=lambda actor: boxes[actor].left)
+
+        # Split into one sorted list per collision group somebody listens for
+        listened = 0
+        for actor in self.order:
+            listened |= actor.collides_with
+        groups = {}
+        for actor in self.order:
+            if actor.collision_group & listened:
+                groups.setdefault(actor.collision_group, []).append(actor)
+        sweeps = [(group, members, [boxes[actor].left for actor in members],
+                   max(boxes[actor].width for actor in members)) for group, members in groups.items()]
+
+        # Listening actors only go through the groups they listen for, and in those only through
+        # the actors whose hitbox could overlap theirs along x: starting less than the widest hitbox
+        # of the group before their left edge, up to their right edge
+        contacts = {}
+        for a in self.order:
+            wants = a.collides_with
+            if not wants:
+                continue
+            a_box = boxes[a]
+            others = []
+            for group, members, lefts, widest in sweeps:
+                if not wants & group:
+                    continue
+                for j in range(bisect_right(lefts, a_box.left - widest), bisect_left(lefts, a_box.right)):
+                    b = members[j]
+                    b_box = boxes[b]
+                    if b is a or b_box.right <= a_box.left or b_box.top >= a_box.bottom or a_box.top >= b_box.bottom:
+                        continue
+                    if touching(a, a_box, b, b_box):
+                        others.append(b)
+            if others:
+                contacts[a] = others
+        return contacts
+
+    def step(self):
+        """ Find every contact first, then tell the actors about them, so actors killed while handling
+            a contact don't change what the others see this step. """
+        for actor, others in self.find_contacts().items():
+            actor.on_touch(others)
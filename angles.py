@@ -0,0 +1,68 @@
+# -------------------------------------------------------------------- #
+# angles.py
+#   the 256 step angles the physics work with, like the hex angles of
+#   the original games, and lookup tables for everything worked out
+#   from them: sine, cosine and which sensor mode an angle is in.
+#   The tables are built once when imported, so moving along slopes
+#   and loops costs the physics a couple of array lookups per actor.
+#   http://info.sonicretro.org/SPG:Slope_Physics
+#
+#   Angles here go counter-clockwise like the degrees elsewhere in the
+#   game, 0 being flat ground and 64 a wall on the right. The original
+#   games count clockwise: their hex angle is (256 - angle) % 256.
+# -------------------------------------------------------------------- #
+
+# General imports:
+import math
+
+import numpy as np
+
+# Steps to a full turn
+ANGLE_STEPS = 256
+
+# Degrees in one step
+ANGLE_DEGREES = 360.0 / ANGLE_STEPS
+
+# Sensor modes, which side of the player the ground is on, see MODE_OF_ANGLE
+MODE_FLOOR = 0
+MODE_RIGHT_WALL = 1
+MODE_CEILING = 2
+MODE_LEFT_WALL = 3
+MODE_NAMES = ("floor", "right wall", "ceiling", "left wall")
+
+# Angle of full tiles, which are flat from whichever side they're looked at, see CollisionGrid.cast().
+# The original games flag these blocks the same way, with hex angle $FF.
+FLAT_ANGLE = -1
+
+# Sine and cosine of each angle, as NumPy arrays to index with a whole array of angles at once,
+# and as tuples for single angles, which index a lot faster that way
+SINE = np.sin(np.arange(ANGLE_STEPS) * (2 * math.pi / ANGLE_STEPS))
+COSINE = np.cos(np.arange(ANGLE_STEPS) * (2 * math.pi / ANGLE_STEPS))
+SINE_TABLE = tuple(SINE.tolist())
+COSINE_TABLE = tuple(COSINE.tolist())
+
+
+def angle_mode(angle):
+    """ The sensor mode of an angle: floor up to 45 degrees either way, walls up to 134 degrees,
+        ceiling from 135 to 225 degrees. The SPG's ranges, rounded to the nearest step. """
+    degrees = round(angle * ANGLE_DEGREES)
+    if degrees <= 45 or degrees >= 315:
+        return MODE_FLOOR
+    if degrees <= 134:
+        return MODE_RIGHT_WALL
+    if degrees <= 225:
+        return MODE_CEILING
+    return MODE_LEFT_WALL
+
+
+# Sensor mode of each angle
+MODE_OF_ANGLE = tuple(angle_mode(angle) for angle in range(ANGLE_STEPS))
+
+
+def degrees_to_angle(degrees):
+    """ The nearest step to an angle in degrees, counter-clockwise. """
+    return int(round(degrees / ANGLE_DEGREES)) % ANGLE_STEPS
+
+
+def angle_to_degrees(angle):
+    return angle * ANGLE_DEGREES
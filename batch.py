@@ -0,0 +1,204 @@
+# -------------------------------------------------------------------- #
+# batch.py
+#   replays recorded input (see replay.py) headless against many sets of
+#   player physics constants, spread over every CPU core, and writes the
+#   trajectory and metrics of every run to a single JSON file. For tuning
+#   the physics without playing through the level by hand.
+#
+#   python batch.py --grid tuning.json --replay session.qrec --output results.json
+#
+#   The grid file holds the values to try for each constant, and every
+#   combination of them is run:
+#       {"gravity": [0.2, 0.21875, 0.25], "jump_speed": [6, 6.5, 7]}
+#   or a list of constant sets, run as they are:
+#       [{"gravity": 0.2}, {"gravity": 0.25, "top_speed": 8}]
+#   Constants left out keep their value from PLAYER_PHYSICS in player.py
+# -------------------------------------------------------------------- #
+
+# General imports:
+import argparse
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import time
+
+# Local imports:
+from constants import *
+from headless import init_headless
+from log import configure as configure_log, flush as flush_log
+from replay import Recording, play_recording
+
+# Physics steps between two trajectory samples
+TRAJECTORY_INTERVAL = 10
+
+# Recordings loaded by this process, path -> Recording
+recordings = {}
+
+
+def expand_grid(grid):
+    """ Return the list of constant sets a grid file asks for. """
+    if isinstance(grid, list):
+        return [dict(variant) for variant in grid]
+    names = sorted(grid)
+    values = [grid[name] if isinstance(grid[name], list) else [grid[name]] for name in names]
+    return [dict(zip(names, combination)) for combination in itertools.product(*values)]
+
+
+def init_worker(log_level):
+    # Each worker process runs without a window, and only logs what it's asked to
+    init_headless()
+    configure_log(log_level)
+
+
+def simulate(job):
+    """ Run one recording with one set of physics constants. Runs in a worker process. """
+    index, physics, path, trajectory_interval = job
+    run = {'index': index, 'physics': physics, 'recording': path}
+    try:
+        run.update(simulate_run(physics, path, trajectory_interval))
+    except Exception as error:
+        # One broken variant shouldn't throw away the rest of the batch
+        run['error'] = "%s: %s" % (type(error).__name__, error)
+    flush_log()
+    return run
+
+
+def simulate_run(physics, path, trajectory_interval):
+    # The worker's pygame was set up by init_worker() by now, see headless.py
+    from game import GameScene
+
+    recording = recordings.get(path)
+    if recording is None:
+        recording = recordings[path] = Recording.load(path)
+
+    start = time.perf_counter()
+    scene = GameScene(physics=physics)
+    scene.start()
+    player = scene.player_one
+    checkpoints = dict((checkpoint[0], checkpoint) for checkpoint in recording.checkpoints)
+
+    trajectory = [[0, player.x, player.y]]
+    max_x = min_y = None
+    max_speed = max_fall_speed = 0.0
+    airborne_steps = landings = 0
+    checkpoint_error = 0.0
+    was_grounded = player.flag_ground
+
+    for step in play_recording(scene, recording):
+        x, y, grounded = player.x, player.y, player.flag_ground
+        max_x = x if max_x is None else max(max_x, x)
+        min_y = y if min_y is None else min(min_y, y)
+        max_speed = max(max_speed, abs(player.x_speed), abs(player.ground_speed))
+        max_fall_speed = max(max_fall_speed, player.y_speed)
+        if not grounded:
+            airborne_steps += 1
+        elif not was_grounded:
+            landings += 1
+        was_grounded = grounded
+
+        # How far off the recorded session this variant ends up
+        expected = checkpoints.get(step)
+        if expected is not None:
+            checkpoint_error = max(checkpoint_error, math.hypot(x - expected[1], y - expected[2]))
+
+        if step % trajectory_interval == 0:
+            trajectory.append([step, x, y])
+
+    return {
+        'steps': recording.steps,
+        'run_time': time.perf_counter() - start,
+        'metrics': {
+            'final_x': player.x,
+            'final_y': player.y,
+            'max_x': max_x,
+            'min_y': min_y,
+            'max_speed': max_speed,
+            'max_fall_speed': max_fall_speed,
+            'airborne_steps': airborne_steps,
+            'landings': landings,
+            'rings': player.rings,
+            'checkpoint_error': checkpoint_error,
+        },
+        'trajectory': trajectory,
+    }
+
+
+def run_batch(variants, recording_paths, workers=None, trajectory_interval=TRAJECTORY_INTERVAL, log_level='warning'):
+    """ Run every recording with every set of constants, on a pool of worker processes.
+        Returns one run per pair, in order: every recording of the first set, then of the second... """
+    from level_cache import load_level
+    from player import PLAYER_PHYSICS
+
+    if not variants or not recording_paths:
+        raise ValueError("Nothing to run, the batch needs at least one set of constants and one recording")
+    for variant in variants:
+        unknown = set(variant) - set(PLAYER_PHYSICS)
+        if unknown:
+            raise ValueError("Unknown player physics constants: %s" % ", ".join(sorted(unknown)))
+
+    # Compile the level cache once up front, instead of every worker racing to do it
+    load_level(LEVEL_01_TMX)
+
+    jobs = [(index, variant, path, trajectory_interval)
+            for index, (variant, path) in enumerate(itertools.product(variants, recording_paths))]
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    runs = []
+    with multiprocessing.Pool(workers, initializer=init_worker, initargs=(log_level,)) as pool:
+        for run in pool.imap_unordered(simulate, jobs):
+            runs.append(run)
+            print("Run %d/%d: %s" % (len(runs), len(jobs), run.get('error') or "%.3fs" % run['run_time']))
+        # Let the workers finish and exit on their own, terminating them while idle can hang
+        pool.close()
+        pool.join()
+    runs.sort(key=lambda run: run['index'])
+    return runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quill Engine physics tuning batch runner")
+    parser.add_argument('--grid', required=True, help="JSON file with the physics constants to try")
+    parser.add_argument('--replay', required=True, action='append', metavar='FILE',
+                        help="recorded input to run every set of constants with, can be given more than once")
+    parser.add_argument('--output', required=True, help="JSON file to write the results to")
+    parser.add_argument('--workers', type=int, help="worker processes, one per CPU core by default")
+    parser.add_argument('--trajectory-interval', type=int, default=TRAJECTORY_INTERVAL, metavar='STEPS',
+                        help="physics steps between trajectory samples")
+    parser.add_argument('--log', default='warning', metavar='LEVELS', help="log levels of the workers, see log.py")
+    args = parser.parse_args()
+    # Checked here, a bad level would otherwise fail in every worker as it starts
+    try:
+        configure_log(args.log)
+    except ValueError as error:
+        parser.error(str(error))
+
+    with open(args.grid) as f:
+        variants = expand_grid(json.load(f))
+
+    if not variants:
+        parser.error("%s has no sets of constants to run" % args.grid)
+
+    start = time.perf_counter()
+    runs = run_batch(variants, args.replay, args.workers, args.trajectory_interval, args.log)
+    batch_time = time.perf_counter() - start
+
+    from player import PLAYER_PHYSICS
+    results = {
+        'timestamp': time.time(),
+        'level': LEVEL_01_TMX,
+        'physics_defaults': PLAYER_PHYSICS,
+        'recordings': args.replay,
+        'trajectory_interval': args.trajectory_interval,
+        'batch_time': batch_time,
+        'runs': runs,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=1)
+
+    failed = sum(1 for run in runs if 'error' in run)
+    print("%d runs in %.1fs, %d failed, results written to %s" % (len(runs), batch_time, failed, args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+# -------------------------------------------------------------------- #
+# benchmark.py
+#   times the engine's hot paths in fixed scenarios, and writes the
+#   results as JSON so runs from different commits can be compared.
+#
+#   python benchmark.py --output bench.json
+#   python benchmark.py --output new.json --compare bench.json
+# -------------------------------------------------------------------- #
+
+# General imports:
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Game library imports:
+import pygame
+
+# Local imports:
+from constants import *
+from headless import init_headless
+
+# Regressions bigger than this (in percent, on the median) make --compare fail
+REGRESSION_THRESHOLD = 10.0
+
+
+def render_target():
+    # What scenes draw on in the game, see display.py
+    return pygame.Surface([SCREEN_WIDTH, SCREEN_HEIGHT]).convert()
+
+
+def percentile(sorted_values, fraction):
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def measure(scenario, iterations):
+    """ Time each iteration of a scenario, then run it again under tracemalloc to count the blocks it leaves allocated.
+        A scenario is a function that sets things up and returns the function to time. """
+    # Timing pass
+    run = scenario()
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    # Allocation pass, kept separate because tracing slows everything down.
+    # Blocks still allocated after the pass, from the difference between two snapshots, show what leaks per iteration
+    run = scenario()
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for _ in range(iterations):
+        run()
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    block_delta = sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+
+    timings.sort()
+    return {
+        'iterations': iterations,
+        'mean_ms': sum(timings) / len(timings),
+        'p50_ms': percentile(timings, 0.50),
+        'p90_ms': percentile(timings, 0.90),
+        'p99_ms': percentile(timings, 0.99),
+        'max_ms': timings[-1],
+        'peak_traced_bytes': peak_bytes,
+        'retained_blocks_per_iteration': block_delta / iterations,
+    }
+
+
+# Scenarios
+
+def scenario_level_compile():
+    # TMX parsing and height mask generation, written to a throwaway cache file
+    from level_cache import compile_level
+    cache_path = os.path.join(tempfile.mkdtemp(), 'level.qlvl')
+    return lambda: compile_level(LEVEL_01_TMX, cache_path)
+
+
+def scenario_level_load():
+    # Mapping the level cache and cutting the tile images of every tile placed in it
+    from level import TileImages
+    from level_cache import load_level
+    load_level(LEVEL_01_TMX)
+
+    def run():
+        level = load_level(LEVEL_01_TMX)
+        tile_images = TileImages(level)
+        for l in level.visible_tile_layers:
+            layer = level.layers[l]
+            for y in range(level.height):
+                for gid in layer.row(y):
+                    tile_images.get(gid)
+    return run
+
+
+def scenario_game_update():
+    # One physics step of the game scene, the player's sensors querying the level included
+    from game import GameScene
+    scene = GameScene()
+    return lambda: scene.update(PHYSICS_STEP)
+
+
+def scenario_game_update_populated():
+    # Like game_update, with 20000 more enemies spread over the level, away from the camera.
+    # Only the objects around the camera are active, so it should take about as long.
+    import random
+    from game import GameScene
+    from level import LevelObject
+    scene = GameScene()
+    width = scene.level.width * scene.level.tile_width
+    height = scene.level.height * scene.level.tile_height
+    first_y = (scene.objects.window_cells(scene.map_layer.view_rect)[3] + 1) * scene.objects.cell_size
+    rng = random.Random(1)
+    for i in range(20000):
+        scene.objects.add(LevelObject(i, 'enemy', None, rng.randrange(width), rng.randrange(first_y, height), 32, 24))
+    return lambda: scene.update(PHYSICS_STEP)
+
+
+def scenario_actor_collisions():
+    # Finding contacts between 1000 walking enemies, and 50 actors looking for them
+    import random
+    from actor_collision import ActorCollisions
+    from entities import EntityStore
+    from level import LevelObject
+    from objects import Enemy
+
+    class Probe(pygame.sprite.Sprite):
+        collision_group = 0
+        collides_with = COLLIDE_ENEMY
+
+        def __init__(self, x, y):
+            super().__init__()
+            self.rect = pygame.Rect(x, y, 32, 32)
+            self.touches = 0
+
+        def on_touch(self, others):
+            self.touches += len(others)
+
+    rng = random.Random(1)
+    entities = EntityStore()
+    enemies = [Enemy(LevelObject(i, 'enemy', None, rng.randrange(4000), rng.randrange(400), 32, 24), entities)
+               for i in range(1000)]
+    probes = [Probe(rng.randrange(4000), rng.randrange(400)) for i in range(50)]
+    actors = ActorCollisions(*(enemies + probes))
+
+    def run():
+        entities.step(PHYSICS_STEP)
+        for enemy in enemies:
+            enemy.update(PHYSICS_STEP)
+        actors.step()
+    return run
+
+
+def scenario_entities_step():
+    # One physics step of a thousand falling actors, without collision
+    from entities import EntityStore
+    entities = EntityStore()
+    for i in range(1000):
+        row = entities.add(i * 4.0, 0.0, gravity=0.21875)
+        entities.x_speed[row] = (i % 7) - 3
+    return lambda: entities.step(PHYSICS_STEP)
+
+
+def scenario_entities_step_slopes():
+    # Like scenario_entities_step, with a thousand actors running along the ground at every angle,
+    # which should cost the same thanks to the angle tables, see angles.py
+    from entities import EntityStore
+    entities = EntityStore()
+    for i in range(1000):
+        row = entities.add(i * 4.0, 0.0, gravity=0.21875, slope=0.125)
+        entities.ground[row] = True
+        entities.angle[row] = i % 256
+        entities.ground_speed[row] = (i % 7) - 3
+    return lambda: entities.step(PHYSICS_STEP)
+
+
+def scenario_game_draw():
+    # Drawing the level and sprites through pyscroll's BufferedRenderer, camera standing still.
+    # Everything is drawn every time, like when the player moves, see scenario_game_draw_idle
+    from game import GameScene
+    scene = GameScene()
+    screen = render_target()
+
+    def run():
+        scene.redraw_all = True
+        scene.draw(screen)
+    return run
+
+
+def scenario_game_draw_idle():
+    # Nothing moving at all, nothing needs drawing
+    from game import GameScene
+    scene = GameScene()
+    screen = render_target()
+    return lambda: scene.draw(screen)
+
+
+def scrolling_draw(scene, speed=8):
+    """ Return a function that moves the player sideways by speed pixels and draws the scene. The player
+        turns around at the level's edges, wrapping around would be a jump that redraws everything. """
+    player = scene.player_one
+    screen = render_target()
+    right_edge = scene.level.width * scene.level.tile_width - player.rect.width
+    direction = [speed]
+
+    def run():
+        if not 0 <= player.x + direction[0] <= right_edge:
+            direction[0] = -direction[0]
+        player.x += direction[0]
+        player.sync_rect()
+        scene.follow_player()
+        scene.draw(screen)
+    return run
+
+
+def scenario_game_draw_scrolling():
+    # Same as above, with the camera scrolling sideways so tiles keep getting redrawn
+    from game import GameScene
+    return scrolling_draw(GameScene())
+
+
+def scenario_game_draw_scrolling_chunks():
+    # Like game_draw_scrolling, with the level drawn from pre-baked chunks, see chunk_renderer.py.
+    # Warm: the player runs across the level and back first, so every chunk it passes is already baked
+    from game import GameScene
+    scene = GameScene(renderer='chunks')
+    run = scrolling_draw(scene)
+    for _ in range(2 * scene.level.width * scene.level.tile_width // 8):
+        run()
+    return run
+
+
+def scenario_game_draw_scrolling_chunks_cold():
+    # Like game_draw_scrolling_chunks, keeping only the chunks around the view so every chunk scrolled
+    # into gets baked again, like in a level much bigger than the memory limit
+    from game import GameScene
+    scene = GameScene(renderer='chunks')
+    scene.map_layer.memory_limit = 0
+    return scrolling_draw(scene)
+
+
+def scenario_title_draw():
+    from title import TitleScene
+    scene = TitleScene()
+    screen = render_target()
+
+    def run():
+        scene.redraw_all = True
+        scene.draw(screen)
+    return run
+
+
+def scenario_title_draw_idle():
+    # The title screen once it's been drawn
+    from title import TitleScene
+    scene = TitleScene()
+    screen = render_target()
+    return lambda: scene.draw(screen)
+
+
+def scenario_display_present():
+    # Scaling a whole frame up to the window and showing it
+    from display import Display
+    display = Display(WINDOW_SIZE, 'integer')
+    return lambda: display.present(None)
+
+
+def scenario_display_present_smooth():
+    from display import Display
+    display = Display(WINDOW_SIZE, 'smooth')
+    return lambda: display.present(None)
+
+
+# name -> (scenario, default iterations)
+SCENARIOS = {
+    'level_compile': (scenario_level_compile, 20),
+    'level_load': (scenario_level_load, 50),
+    'game_update': (scenario_game_update, 2000),
+    'game_update_populated': (scenario_game_update_populated, 2000),
+    'entities_step': (scenario_entities_step, 2000),
+    'entities_step_slopes': (scenario_entities_step_slopes, 2000),
+    'actor_collisions': (scenario_actor_collisions, 500),
+    'game_draw': (scenario_game_draw, 500),
+    'game_draw_idle': (scenario_game_draw_idle, 500),
+    'game_draw_scrolling': (scenario_game_draw_scrolling, 500),
+    'game_draw_scrolling_chunks': (scenario_game_draw_scrolling_chunks, 500),
+    'game_draw_scrolling_chunks_cold': (scenario_game_draw_scrolling_chunks_cold, 500),
+    'title_draw': (scenario_title_draw, 500),
+    'title_draw_idle': (scenario_title_draw_idle, 500),
+    'display_present': (scenario_display_present, 500),
+    'display_present_smooth': (scenario_display_present_smooth, 500),
+}
+
+
+def compare(results, baseline):
+    """ Print how each scenario's median changed against a previous run. Returns True if nothing regressed. """
+    ok = True
+    for name, result in results['scenarios'].items():
+        old = baseline['scenarios'].get(name)
+        if not old or not old['p50_ms']:
+            continue
+        change = (result['p50_ms'] - old['p50_ms']) / old['p50_ms'] * 100
+        regressed = change > REGRESSION_THRESHOLD
+        ok = ok and not regressed
+        print("%-31s %8.3fms -> %8.3fms  %+6.1f%%%s" % (name, old['p50_ms'], result['p50_ms'], change,
+                                                     "  REGRESSION" if regressed else ""))
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quill Engine benchmarks")
+    parser.add_argument('scenarios', nargs='*', metavar='SCENARIO',
+                        help="scenarios to run, all of them by default: %s" % ", ".join(SCENARIOS))
+    parser.add_argument('--iterations', type=int, help="iterations per scenario, instead of the defaults")
+    parser.add_argument('--output', help="file to write the JSON results to")
+    parser.add_argument('--compare', help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error("unknown scenario %s" % name)
+
+    # No window, but a display surface so images get converted like in the game
+    init_headless()
+    pygame.display.set_mode(WINDOW_SIZE)
+
+    results = {
+        'timestamp': time.time(),
+        'python': sys.version.split()[0],
+        'pygame': pygame.version.ver,
+        'platform': sys.platform,
+        'scenarios': {},
+    }
+    for name in args.scenarios or SCENARIOS:
+        scenario, iterations = SCENARIOS[name]
+        result = measure(scenario, args.iterations or iterations)
+        results['scenarios'][name] = result
+        print("%-31s p50 %8.3fms  p90 %8.3fms  p99 %8.3fms  max %8.3fms"
+              % (name, result['p50_ms'], result['p90_ms'], result['p99_ms'], result['max_ms']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            if not compare(results, json.load(f)):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+# -------------------------------------------------------------------- #
+# chunk_renderer.py
+#   a stand-in for pyscroll's BufferedRenderer that draws the level from
+#   pre-baked chunks. The static tiles of every visible layer are drawn
+#   once into big chunk surfaces, so a frame is a few chunk blits plus
+#   the animated tiles, however fast the camera scrolls. BufferedRenderer
+#   instead draws a row or column of tiles into its buffer every time the
+#   camera crosses a tile edge, which shows up as frame time spikes when
+#   the player runs at top speed. The chunks around the view are baked
+#   ahead of time, a few rows of tiles per frame so no frame waits on a
+#   whole chunk. Baked chunks are kept up to a memory limit, and evicted
+#   least recently used first.
+#
+#   python main.py --renderer chunks
+# -------------------------------------------------------------------- #
+
+# General imports:
+from collections import OrderedDict
+
+# Game library imports:
+import pygame
+
+# Local imports:
+from constants import *
+
+LEVEL_RENDERERS = ('buffered', 'chunks')
+
+# What the level is baked onto where it has no tiles, same as pyscroll's buffer
+CHUNK_CLEAR_COLOR = (0, 0, 0)
+
+
+class RenderChunk(object):
+    """ The static tiles of a chunk_size x chunk_size block of the level, baked into one surface
+        a few rows at a time, see ChunkRenderer.bake_rows(). """
+
+    def __init__(self, grid_x, grid_y, width, height, tile_size, animated):
+        # Grid position and size in tiles. Chunks on the right and bottom edges of the level
+        # only cover what's left of it
+        self.grid_x, self.grid_y = grid_x, grid_y
+        self.width, self.height = width, height
+
+        self.surface = pygame.Surface((width * tile_size[0], height * tile_size[1]))
+        self.surface.fill(CHUNK_CLEAR_COLOR)
+
+        # Rows of tiles baked so far, the chunk can only be drawn once all of them are
+        self.baked_rows = 0
+
+        # (x, y, layer, gid) of every animated tile, whose whole column is left out of the
+        # baked surface and drawn each frame instead, see ChunkRenderer.draw_animated()
+        self.animated = animated
+        self.animated_cells = set((x, y) for x, y, l, gid in animated)
+
+    @property
+    def baked(self):
+        return self.baked_rows == self.height
+
+    @property
+    def memory(self):
+        return self.surface.get_width() * self.surface.get_height() * self.surface.get_bytesize()
+
+
+class ChunkRenderer(object):
+    """ Draws a pyscroll data source (see level.py) from baked chunks. Has the parts of BufferedRenderer's
+        interface the game uses, so it can be handed to a PyscrollGroup in its place.
+        Sprites are drawn under the tiles of higher layers like BufferedRenderer does. """
+
+    def __init__(self, data, size, clamp_camera=True, chunk_size=RENDER_CHUNK_SIZE,
+                 memory_limit=RENDER_CHUNK_MEMORY, margin=RENDER_CHUNK_MARGIN, bake_rows=RENDER_CHUNK_BAKE_ROWS):
+        self.data = data
+        self.clamp_camera = clamp_camera
+        self.chunk_size = chunk_size
+        self.memory_limit = memory_limit
+        self.margin = margin
+        self.bake_rows_per_frame = bake_rows
+
+        self.tile_width, self.tile_height = data.tile_size
+        self.map_width, self.map_height = data.map_size
+        self.chunk_width = chunk_size * self.tile_width
+        self.chunk_height = chunk_size * self.tile_height
+
+        # Size of the level in chunks
+        self.columns = (self.map_width + chunk_size - 1) // chunk_size
+        self.rows = (self.map_height + chunk_size - 1) // chunk_size
+
+        self.map_rect = pygame.Rect(0, 0, self.map_width * self.tile_width, self.map_height * self.tile_height)
+        self.view_rect = pygame.Rect((0, 0), size)
+        self.tile_layers = tuple(sorted(data.visible_tile_layers))
+
+        # (chunk_x, chunk_y) -> RenderChunk, least recently used first
+        self.chunks = OrderedDict()
+        self.memory = 0
+
+        # Chunks in view, and the ones around them that get baked ahead of time, see update_chunks()
+        self.visible = []
+        self.needed = set()
+
+    # Camera
+
+    def center(self, coords):
+        x, y = round(coords[0]), round(coords[1])
+        self.view_rect.center = x, y
+        if self.clamp_camera:
+            self.view_rect.clamp_ip(self.map_rect)
+        self.update_chunks()
+
+    def get_center_offset(self):
+        return -self.view_rect.left, -self.view_rect.top
+
+    def translate_point(self, point):
+        return int(point[0] - self.view_rect.left), int(point[1] - self.view_rect.top)
+
+    def translate_rect(self, rect):
+        return pygame.Rect(rect).move(-self.view_rect.left, -self.view_rect.top)
+
+    # Baking
+
+    def chunks_in_view(self, margin=0):
+        """ Return the keys of the chunks overlapped by the view, plus margin chunks around it. """
+        view_rect = self.view_rect
+        first_x = max(view_rect.left // self.chunk_width - margin, 0)
+        last_x = min((view_rect.right - 1) // self.chunk_width + margin, self.columns - 1)
+        first_y = max(view_rect.top // self.chunk_height - margin, 0)
+        last_y = min((view_rect.bottom - 1) // self.chunk_height + margin, self.rows - 1)
+        return [(x, y) for y in range(first_y, last_y + 1) for x in range(first_x, last_x + 1)]
+
+    def new_chunk(self, key):
+        """ Start a chunk, with none of its tiles baked yet. """
+        data = self.data
+        first_x, first_y = key[0] * self.chunk_size, key[1] * self.chunk_size
+        last_x = min(first_x + self.chunk_size, self.map_width)
+        last_y = min(first_y + self.chunk_size, self.map_height)
+
+        # Animated tiles can only be found by their gid, which needs the level's layers
+        animated = []
+        tracked_gids = data._tracked_gids if data._animation_queue else ()
+        if tracked_gids:
+            for l in self.tile_layers:
+                layer = data.level.layers[l]
+                for y in range(first_y, last_y):
+                    row = layer.row(y)
+                    for x in range(first_x, last_x):
+                        if row[x] in tracked_gids:
+                            animated.append((x, y, l, row[x]))
+
+        chunk = self.chunks[key] = RenderChunk(first_x, first_y, last_x - first_x, last_y - first_y,
+                                               (self.tile_width, self.tile_height), animated)
+        self.memory += chunk.memory
+        return chunk
+
+    def bake_rows(self, chunk, count):
+        """ Bake the next count rows of a chunk's tiles. Returns how many rows that was. """
+        count = min(count, chunk.height - chunk.baked_rows)
+        tw, th = self.tile_width, self.tile_height
+        left, top = chunk.grid_x * tw, chunk.grid_y * th
+        skipped = chunk.animated_cells
+        tiles = self.data.get_tile_images_by_rect(pygame.Rect(chunk.grid_x, chunk.grid_y + chunk.baked_rows,
+                                                              chunk.width, count))
+        chunk.surface.blits([(image, (x * tw - left, y * th - top)) for x, y, l, image in tiles
+                             if not skipped or (x, y) not in skipped], doreturn=False)
+        chunk.baked_rows += count
+        return count
+
+    def distance_to_view(self, key):
+        center_x, center_y = self.view_rect.center
+        return (abs((key[0] + 0.5) * self.chunk_width - center_x)
+                + abs((key[1] + 0.5) * self.chunk_height - center_y))
+
+    def update_chunks(self):
+        self.visible = self.chunks_in_view()
+        needed = self.chunks_in_view(self.margin)
+        self.needed = set(needed)
+        chunks = self.chunks
+
+        # The chunks in view have to be there for the next frame. They only aren't when the camera jumped,
+        # or scrolled faster than the chunks around the view got baked
+        for key in self.visible:
+            chunk = chunks.get(key) or self.new_chunk(key)
+            if not chunk.baked:
+                self.bake_rows(chunk, chunk.height)
+            chunks.move_to_end(key)
+
+        # The chunks around the view are baked a few rows per frame, nearest first,
+        # so scrolling never waits on a whole chunk being baked
+        needed.sort(key=self.distance_to_view)
+        rows = self.bake_rows_per_frame
+        for key in needed:
+            if rows <= 0:
+                break
+            chunk = chunks.get(key) or self.new_chunk(key)
+            if not chunk.baked:
+                rows -= self.bake_rows(chunk, rows)
+
+        # Evict the least recently used chunks once over the limit, never the ones around the view
+        for key in list(chunks):
+            if self.memory <= self.memory_limit:
+                break
+            if key not in self.needed:
+                self.memory -= chunks.pop(key).memory
+
+    # Drawing
+
+    def draw(self, surface, rect, surfaces=None):
+        """ Draw the level onto rect of a surface, and the (image, screen rect, layer[, blend])
+            surfaces over it, like BufferedRenderer.draw(). Returns the rect drawn over. """
+        left = rect.left - self.view_rect.left
+        top = rect.top - self.view_rect.top
+        previous_clip = surface.get_clip()
+        surface.set_clip(rect)
+
+        chunks = self.chunks
+        blits = []
+        animated = []
+        for key in self.visible:
+            chunk = chunks[key]
+            blits.append((chunk.surface, (key[0] * self.chunk_width + left, key[1] * self.chunk_height + top)))
+            if chunk.animated:
+                animated.append(chunk)
+        surface.blits(blits, doreturn=False)
+
+        if animated:
+            self.draw_animated(surface, animated, left, top)
+        if surfaces:
+            self.draw_surfaces(surface, surfaces, left, top)
+
+        surface.set_clip(previous_clip)
+        drawn = pygame.Rect(rect)
+        drawn.size = self.view_rect.size
+        return drawn
+
+    def draw_animated(self, surface, chunks, left, top):
+        """ Draw the columns of tiles that have an animated tile in them, with its current frame. """
+        data = self.data
+        tw, th = self.tile_width, self.tile_height
+        animation_map = data._animation_map
+        for chunk in chunks:
+            # The data source forgets tiles that go out of view, remind it of the ones in view
+            for x, y, l, gid in chunk.animated:
+                animation_map[gid].positions.add((x, y, l))
+        tile_view = pygame.Rect(self.view_rect.left // tw, self.view_rect.top // th,
+                                self.view_rect.width // tw + 2, self.view_rect.height // th + 2)
+        data.process_animation_queue(tile_view)
+
+        get_tile = data.get_tile_image
+        clip = surface.get_clip()
+        for chunk in chunks:
+            for x, y in chunk.animated_cells:
+                position = (x * tw + left, y * th + top)
+                # fill() moves a rect hanging off the left or top edge inside instead of cutting it off
+                surface.fill(CHUNK_CLEAR_COLOR, clip.clip((position, (tw, th))))
+                for l in self.tile_layers:
+                    tile = get_tile(x, y, l)
+                    if tile:
+                        surface.blit(tile, position)
+
+    def draw_surfaces(self, surface, surfaces, left, top):
+        """ Draw sprites, and redraw the columns of tiles they overlap which have a tile of a higher
+            layer in them, sorted the same way as BufferedRenderer._draw_surfaces(). """
+        tw, th = self.tile_width, self.tile_height
+        get_tile = self.data.get_tile_image
+        top_layer = self.tile_layers[-1]
+        blit_list = []
+        damage = set()
+        order = 0
+
+        for item in surfaces:
+            image, screen_rect, layer = item[:3]
+            blend = item[3] if len(item) > 3 else None
+            x, y, width, height = screen_rect
+
+            # Tiles the sprite covers, only matter if it's not over the top layer
+            if layer <= top_layer and width > 0 and height > 0:
+                first_x = max((x - left) // tw, 0)
+                last_x = min((x - left + width - 1) // tw, self.map_width - 1)
+                first_y = max((y - top) // th, 0)
+                last_y = min((y - top + height - 1) // th, self.map_height - 1)
+                for tile_y in range(first_y, last_y + 1):
+                    for tile_x in range(first_x, last_x + 1):
+                        damage.add((layer, tile_x, tile_y))
+
+            blit_list.append((layer, 1, x, y, order, image, blend))
+            order += 1
+
+        for damaged_layer, tile_x, tile_y in damage:
+            column = []
+            is_over = False
+            screen_x, screen_y = tile_x * tw + left, tile_y * th + top
+            for l in self.tile_layers:
+                tile = get_tile(tile_x, tile_y, l)
+                if tile:
+                    if damaged_layer <= l:
+                        is_over = True
+                    column.append((l, 0, screen_x, screen_y, order, tile, None))
+                    order += 1
+            if is_over:
+                blit_list.extend(column)
+
+        blit_list.sort()
+        surface.blits([(image, (x, y)) if blend is None else (image, (x, y), None, blend)
+                       for l, priority, x, y, order, image, blend in blit_list], doreturn=False)
@@ -0,0 +1,162 @@
+# -------------------------------------------------------------------- #
+# collision_grid.py
+#   the level's collision layer as NumPy arrays, so every sensor of
+#   every actor can be resolved in one vectorized call each physics step,
+#   or one at a time when there are only a few of them. Both follow the
+#   sensor process: http://info.sonicretro.org/SPG:Solid_Tiles#Sensor_Process
+#
+#   distance, found, angle = grid.cast(x, y, axis, sign)
+#   distance, found, angle = grid.cast_one(x, y, axis, sign)
+# -------------------------------------------------------------------- #
+
+# General imports:
+import numpy as np
+
+# Local imports:
+from angles import FLAT_ANGLE
+from constants import *
+
+
+class CollisionGrid(object):
+    """ The collision layer's gids turned into indexes in a table of height masks.
+
+        runs[index, axis] is the height mask's heights (axis 1) or widths (axis 0), and angles[index]
+        its surface angle (see angles.py), index 0 being the empty tile.
+        cells[y, x] is the index of each tile of the level. """
+
+    def __init__(self, level):
+        self.width, self.height = level.width, level.height
+        self.tile_size = np.array(TILE_DIMENSIONS)
+
+        gids = sorted(level.height_masks)
+        size = max(TILE_DIMENSIONS)
+        self.runs = np.zeros((len(gids) + 1, 2, size), np.int16)
+        self.angles = np.full(len(gids) + 1, FLAT_ANGLE, np.int16)
+        for index, gid in enumerate(gids, 1):
+            height_mask = level.height_masks[gid]
+            self.runs[index, 1, :len(height_mask.heights)] = height_mask.heights
+            self.runs[index, 0, :len(height_mask.widths)] = height_mask.widths
+            self.angles[index] = height_mask.angle
+
+        # gid -> index in the tables above, 0 for gids without a height mask
+        index_of_gid = np.zeros(max(gids + [level.tile_count]) + 1, np.int16)
+        index_of_gid[gids] = np.arange(1, len(gids) + 1)
+
+        if COLLISION_LAYER in level.layernames:
+            layer = np.asarray(level.get_layer_by_name(COLLISION_LAYER).data).reshape(self.height, self.width)
+            self.cells = index_of_gid[layer]
+        else:
+            self.cells = np.zeros((self.height, self.width), np.int16)
+
+        # Flat copy of cells with an empty tile at the end, which every position outside of the level maps to
+        self.flat_cells = np.append(self.cells.ravel(), 0)
+
+        # The same tables as lists, indexing NumPy arrays one item at a time is slow, see cast_one()
+        self.cell_rows = self.cells.tolist()
+        self.run_table = self.runs.tolist()
+        self.angle_table = self.angles.tolist()
+
+    def tile_index(self, grid_x, grid_y):
+        # Index of the tiles at grid positions, 0 outside of the level
+        inside = (grid_x >= 0) & (grid_x < self.width) & (grid_y >= 0) & (grid_y < self.height)
+        return self.flat_cells[np.where(inside, grid_y * self.width + grid_x, -1)]
+
+    def surface_run(self, index, axis, sign, offset, size):
+        # How many pixels of a tile's column/row are solid, counted from the side facing the sensor.
+        # Heights/widths are measured from the bottom/right, or the top/left when negative.
+        # Seen from the other side, any solid pixels at all make the tile look full.
+        value = self.runs[index, axis, offset]
+        return np.where(sign > 0,
+                        np.where(value >= 0, value, size),
+                        np.where(value <= 0, -value, size))
+
+    def cast(self, x, y, axis, sign):
+        """ Look for the nearest solid surface from each pixel position x, y,
+            along axis (0 horizontal, 1 vertical) in the direction of sign (1 right/down, -1 left/up).
+
+            Returns three arrays: the distance to the surface (negative when already inside of it),
+            whether a surface was found at all (the distance means nothing otherwise),
+            and the angle of the tile the surface belongs to, in steps of angles.py. """
+        x, y = np.asarray(x, np.int64), np.asarray(y, np.int64)
+        axis, sign = np.asarray(axis, np.int64), np.asarray(sign, np.int64)
+        vertical = axis == 1
+
+        # Position along the direction the sensor looks, and which height/width array entry to use
+        along = np.where(vertical, y, x)
+        size = self.tile_size[axis]
+        offset = np.where(vertical, x % TILE_DIMENSIONS[0], y % TILE_DIMENSIONS[1])
+        tile_start = along - along % size
+
+        # The tile under each sensor, the next one along and the one before it, looked up together
+        steps = np.array([[0], [1], [-1]]) * sign
+        grid_x = x // TILE_DIMENSIONS[0] + np.where(vertical, 0, steps)
+        grid_y = y // TILE_DIMENSIONS[1] + np.where(vertical, steps, 0)
+        indexes = self.tile_index(grid_x, grid_y)
+        index, next_index, previous_index = indexes
+        run, next_run, previous_run = self.surface_run(indexes, axis, sign, offset, size)
+
+        # An empty tile means the sensor has to check the next tile along instead
+        empty = run == 0
+        run = np.where(empty, next_run, run)
+        index = np.where(empty, next_index, index)
+        tile_start = tile_start + np.where(empty, sign * size, 0)
+
+        # A full tile means the sensor has to check the tile before it, and use that if it isn't empty
+        use_previous = ~empty & (run == size) & (previous_run != 0)
+        run = np.where(use_previous, previous_run, run)
+        index = np.where(use_previous, previous_index, index)
+        tile_start = tile_start - np.where(use_previous, sign * size, 0)
+
+        distance = np.where(sign > 0, tile_start + size - run - along, along - (tile_start + run - 1))
+
+        # Full tiles are flat facing the sensor: floor when it looks down, a wall on the right when it looks right...
+        angle = self.angles[index]
+        facing = np.where(vertical, np.where(sign > 0, 0, 128), np.where(sign > 0, 64, 192))
+        return distance, run != 0, np.where(angle == FLAT_ANGLE, facing, angle)
+
+    def tile_run(self, grid_x, grid_y, axis, sign, offset, size):
+        # surface_run() of a single tile, along with its index
+        if 0 <= grid_x < self.width and 0 <= grid_y < self.height:
+            index = self.cell_rows[grid_y][grid_x]
+        else:
+            index = 0
+        value = self.run_table[index][axis][offset]
+        if sign > 0:
+            return index, value if value >= 0 else size
+        return index, -value if value <= 0 else size
+
+    def cast_one(self, x, y, axis, sign):
+        """ cast() for a single pixel position, in plain Python. Returns the distance, whether a surface
+            was found and its angle. For a few sensors this beats setting up the arrays. """
+        tile_width, tile_height = TILE_DIMENSIONS
+        size = TILE_DIMENSIONS[axis]
+        grid_x, grid_y = x // tile_width, y // tile_height
+        if axis == 1:
+            along, offset = y, x % tile_width
+            step_x, step_y = 0, sign
+        else:
+            along, offset = x, y % tile_height
+            step_x, step_y = sign, 0
+        tile_start = along - along % size
+
+        index, run = self.tile_run(grid_x, grid_y, axis, sign, offset, size)
+        if run == 0:
+            # An empty tile means the sensor has to check the next tile along instead
+            index, run = self.tile_run(grid_x + step_x, grid_y + step_y, axis, sign, offset, size)
+            tile_start += sign * size
+        elif run == size:
+            # A full tile means the sensor has to check the tile before it, and use that if it isn't empty
+            previous_index, previous_run = self.tile_run(grid_x - step_x, grid_y - step_y, axis, sign, offset, size)
+            if previous_run:
+                index, run = previous_index, previous_run
+                tile_start -= sign * size
+
+        if sign > 0:
+            distance = tile_start + size - run - along
+        else:
+            distance = along - (tile_start + run - 1)
+
+        angle = self.angle_table[index]
+        if angle == FLAT_ANGLE:
+            angle = (0 if sign > 0 else 128) if axis == 1 else (64 if sign > 0 else 192)
+        return distance, run != 0, angle
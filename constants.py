@@ -11,14 +11,42 @@ FPS = 60
 GAMESPEED = 1 / FPS
 SCALE = 60
 
+# Physics runs in fixed steps of this many milliseconds, whatever the frame rate
+PHYSICS_STEP = 1000 / 60
+# Most physics steps run in a single frame to catch up, the rest of the time is dropped
+MAX_PHYSICS_STEPS = 5
+
 # Asset paths
 TITLE_FONT = 'assets/fonts/pixeldroidBoticRegular.ttf'
 HUD_FONT = 'assets/fonts/alagard_by_pix3m-d6awiwp.ttf'
-CHARACTER_SHEET = 'assets/sprites/sonicmania.png'
+CHARACTER_ANIMATIONS = 'assets/sprites/sonic.json'
 LEVEL_01_TMX = 'assets/levels/ghz1.tmx'
 LEVEL_01_TSX = 'assets/levels/ghz.tsx'
 LEVEL_01_TILESET = 'assets/tilesets/cavestory-sand.png'
 
+# Name of the Tiled layer holding the collision mask tiles
+COLLISION_LAYER = "Collision Mask"
+
+# Level rendering, see chunk_renderer.py. The renderer can be changed with main.py --renderer
+LEVEL_RENDERER = 'buffered' # 'buffered' draws through pyscroll's BufferedRenderer, 'chunks' blits pre-baked chunks
+RENDER_CHUNK_SIZE = 16 # width & height of a baked chunk, in tiles
+RENDER_CHUNK_MEMORY = 16 * 1024 * 1024 # most bytes of baked chunks kept at once
+RENDER_CHUNK_MARGIN = 1 # chunks around the camera view to bake ahead of time
+RENDER_CHUNK_BAKE_ROWS = 4 # rows of tiles of those baked per frame, a 16px per frame scroll needs about 4
+
+# Placed objects, see object_spawner.py
+OBJECT_CELL_SIZE = 128 # width & height of a cell of the object index, in pixels
+OBJECT_ACTIVATION_MARGIN = 1 # cells around the camera view whose objects are active
+
+# Actor collision groups, see actor_collision.py
+COLLIDE_PLAYER = 1
+COLLIDE_ITEM = 2 # rings, monitors
+COLLIDE_ENEMY = 4
+COLLIDE_PROJECTILE = 8
+
+# Physics steps the player can't be hurt for after getting hit
+PLAYER_INVULNERABLE_STEPS = 120
+
 # Player states
 STOPPED_STATE = "stopped"
 WALKING_STATE = "walking"
@@ -34,14 +62,10 @@ SENSOR_RIGHT_WALL = "right wall"
 SENSOR_LEFT_WALL = "left wall"
 
 # Sonic spritesheets & animations
-WALK_FRAMES_COUNT = 12 # there are 12 walk right sonic frames
-WALK_START_POS = (1, 142) # x and y of right walking sprites on the sprite sheet
-STAND_FRAMES_COUNT = 1
-STAND_START_POS = (1, 13)
-
-FRAME_SPACING = 1 # each sprite canvas is seperated by 1 pixel
+# Where the frames are on the sheet is in the animation file (CHARACTER_ANIMATIONS), see sprite_atlas.py
 FRAME_WIDTH = 48 # each sonic sprite is 48 pixels wide, by 48 pixels high
 FRAME_HEIGHT = 48
+ROTATION_STEPS = 8 # sprites are rotated in steps of 360 / ROTATION_STEPS degrees, like on slopes
 
 # Colors
 BLACK = (0, 0, 0)
@@ -60,9 +84,24 @@ BROWN = (100, 40, 0)
 TITLE_BG_COLOR = BLACK
 GAME_BG_COLOR = GREEN
 
-# Screen dimensions
-SCREEN_WIDTH = 640
-SCREEN_HEIGHT = 480
+# Screen dimensions, the native resolution the game is drawn at
+SCREEN_WIDTH = 424
+SCREEN_HEIGHT = 240
+
+# Window the game is scaled up to, see display.py. Both can be changed with main.py --window and --scaling
+WINDOW_SIZE = (1272, 720)
+SCALING_MODE = 'integer' # 'integer' keeps pixels square and sharp, 'smooth' fills more of the window
+
+# Debug mode profiler, see profiler.py
+PROFILER_GRAPH_SIZE = (240, 80) # frame time graph, one pixel column per frame
+PROFILE_DUMP_FILE = 'profile-%Y%m%d-%H%M%S.json' # F11 in debug mode, formatted with time.strftime
+DEBUG_PROFILER_REFRESH = 30 # frames between refreshes of the profiler text in the debug overlay
+DEBUG_LOG_LINES = 5 # latest log messages shown in the debug overlay
+
+# Logging, see log.py
+LOG_LEVEL = 'info' # level of every category not given one with main.py --log
+LOG_HISTORY = 100 # messages kept for the debug overlay
+LOG_FLUSH_SIZE = 50 # messages waiting before they're written out without waiting for the end of the frame
 
 # Collision mask colors
 MASK_BG_COLOR = RED
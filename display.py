@@ -0,0 +1,103 @@
+# -------------------------------------------------------------------- #
+# display.py
+#   the game is drawn at a small native resolution (SCREEN_WIDTH x
+#   SCREEN_HEIGHT), onto an off-screen surface, which is scaled up once
+#   per frame to fill whatever window size was picked. Integer scaling
+#   keeps pixels sharp and square, with black bars around the picture;
+#   smooth scaling fills as much of the window as the aspect ratio allows.
+#
+#   display = Display((1280, 720), 'integer')
+#   dirty_rects = scene.draw(display.surface)
+#   display.present(dirty_rects, scene)
+#
+#   python main.py --window 1280x720 --scaling smooth
+# -------------------------------------------------------------------- #
+
+# Game library imports:
+import pygame
+
+# Local imports:
+from constants import *
+
+SCALING_MODES = ('integer', 'smooth')
+
+
+def parse_size(text):
+    """ "1280x720" -> (1280, 720) """
+    width, _, height = text.lower().partition('x')
+    size = (int(width), int(height))
+    if min(size) <= 0:
+        raise ValueError("Window size must be positive, got %r" % text)
+    return size
+
+
+class Display(object):
+    """ The window, and the native resolution surface scenes draw on. """
+
+    def __init__(self, window_size=WINDOW_SIZE, scaling=SCALING_MODE, render_size=(SCREEN_WIDTH, SCREEN_HEIGHT)):
+        if scaling not in SCALING_MODES:
+            raise ValueError("Unknown scaling %r, use one of %s" % (scaling, ", ".join(SCALING_MODES)))
+        self.scaling = scaling
+        render_width, render_height = render_size
+        if window_size[0] < render_width or window_size[1] < render_height:
+            raise ValueError("The window can't be smaller than the game's %dx%d resolution" % render_size)
+        self.window = pygame.display.set_mode(window_size)
+        window_width, window_height = self.window.get_size()
+
+        # How many window pixels each native pixel becomes
+        scale = min(window_width / render_width, window_height / render_height)
+        self.scale = int(scale) if scaling == 'integer' else scale
+
+        # Where the picture goes in the window, centered with bars around it
+        self.picture = pygame.Rect(0, 0, round(render_width * self.scale), round(render_height * self.scale))
+        self.picture.center = self.window.get_rect().center
+
+        # Nothing to scale when the picture is the native resolution, scenes draw straight on the window
+        if self.picture.size == tuple(render_size):
+            self.scale = 1
+            self.surface = self.window.subsurface(self.picture)
+        else:
+            self.surface = pygame.Surface(render_size).convert()
+
+    def to_window(self, rect):
+        """ Move and scale a rect on the native resolution surface to where it ends up in the window. """
+        rect = pygame.Rect(rect)
+        return pygame.Rect(self.picture.x + int(rect.x * self.scale), self.picture.y + int(rect.y * self.scale),
+                           round(rect.width * self.scale), round(rect.height * self.scale))
+
+    def present(self, dirty_rects, scene=None):
+        """ Scale what a scene drew to the window, and show it. dirty_rects is what the scene's draw()
+            returned: None for everything, or the list of rects that changed.
+            The scene then gets to draw its overlay at the window's resolution, see Scene.draw_overlay(). """
+        if dirty_rects is not None and not dirty_rects:
+            return
+
+        if self.scale == 1:
+            window_rects = None if dirty_rects is None else [self.to_window(rect) for rect in dirty_rects]
+        elif dirty_rects is None or self.scaling == 'smooth':
+            # Smooth scaling blends neighbouring pixels, parts of the picture can't be scaled on their own
+            self.window.fill(BLACK)
+            if self.scaling == 'smooth':
+                pygame.transform.smoothscale(self.surface, self.picture.size, self.window.subsurface(self.picture))
+            else:
+                pygame.transform.scale(self.surface, self.picture.size, self.window.subsurface(self.picture))
+            window_rects = None
+        else:
+            # Integer scaling maps each native pixel to a block of window pixels, so rects scale on their own
+            window_rects = []
+            surface_rect = self.surface.get_rect()
+            for rect in dirty_rects:
+                rect = pygame.Rect(rect).clip(surface_rect)
+                if rect.width and rect.height:
+                    window_rect = self.to_window(rect)
+                    pygame.transform.scale(self.surface.subsurface(rect), window_rect.size,
+                                           self.window.subsurface(window_rect))
+                    window_rects.append(window_rect)
+
+        if scene is not None and scene.draw_overlay(self.window, self):
+            window_rects = None
+
+        if window_rects is None:
+            pygame.display.flip()
+        else:
+            pygame.display.update(window_rects)
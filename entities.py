@@ -0,0 +1,232 @@
+# -------------------------------------------------------------------- #
+# entities.py
+#   keeps the physics state of every actor (player, rings, enemies,
+#   debris...) in NumPy arrays, one row per actor, so gravity, movement
+#   and states are worked out for all of them at once each physics step.
+#   Actors like the Player are thin views over their row.
+#
+#   row = entities.add(x, y)
+#   entities.step(dt, collide)
+# -------------------------------------------------------------------- #
+
+# General imports:
+import struct
+
+import numpy as np
+
+# Local imports:
+from angles import COSINE, SINE
+from constants import *
+
+# States, stored in the state array as their index in this tuple
+STATES = (STOPPED_STATE, WALKING_STATE, RUNNING_STATE, DASHING_STATE, JUMPING_STATE, ROLLING_STATE)
+STATE_CODES = {state: code for code, state in enumerate(STATES)}
+
+# Ground speeds at which grounded actors start running and dashing, see classify_states()
+RUN_SPEED = 6
+DASH_SPEED = 10
+SPEED_BANDS = np.array([0, RUN_SPEED, DASH_SPEED], np.float64)
+
+# State of each speed band: standing still, up to RUN_SPEED, up to DASH_SPEED, faster
+BAND_STATES = np.array([STATE_CODES[STOPPED_STATE], STATE_CODES[WALKING_STATE],
+                        STATE_CODES[RUNNING_STATE], STATE_CODES[DASHING_STATE]], np.int8)
+
+# Rows the store starts with, it doubles whenever it runs out
+ENTITY_CAPACITY = 64
+
+# Snapshot header: rows in use, removed rows. See EntityStore.snapshot()
+ENTITY_SNAPSHOT_HEADER = struct.Struct('<II')
+
+
+class EntityStore(object):
+    """ Struct of arrays holding the physics state of every actor.
+        Rows of removed actors are reused by the next ones added. """
+
+    # name -> dtype of each per-actor array
+    FIELDS = {
+        'x': np.float64,
+        'y': np.float64,
+        'previous_x': np.float64,
+        'previous_y': np.float64,
+        'x_speed': np.float64,
+        'y_speed': np.float64,
+        'ground_speed': np.float64,
+        'gravity': np.float64,
+        'slope': np.float64,
+        'angle': np.uint8,
+        'ground': np.bool_,
+        'active': np.bool_,
+        'state': np.int8,
+        'frame_index': np.int16,
+        # Ends of the stretch of x patrolling actors walk back and forth on, the same for the rest
+        'patrol_left': np.float64,
+        'patrol_right': np.float64,
+    }
+
+    def __init__(self, capacity=ENTITY_CAPACITY):
+        self.capacity = capacity
+        for name, dtype in self.FIELDS.items():
+            setattr(self, name, np.zeros(capacity, dtype))
+
+        # Rows in use are all below count, free_rows are the removed ones below it
+        self.count = 0
+        self.free_rows = []
+
+    def __len__(self):
+        return self.count - len(self.free_rows)
+
+    def grow(self):
+        self.capacity *= 2
+        for name in self.FIELDS:
+            array = getattr(self, name)
+            grown = np.zeros(self.capacity, array.dtype)
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+
+    def add(self, x, y, gravity=0.0, state=STOPPED_STATE, slope=0.0):
+        """ Add an actor standing still at x, y. Returns its row. """
+        if self.free_rows:
+            row = self.free_rows.pop()
+        else:
+            if self.count == self.capacity:
+                self.grow()
+            row = self.count
+            self.count += 1
+
+        for name in self.FIELDS:
+            getattr(self, name)[row] = 0
+        self.x[row] = self.previous_x[row] = x
+        self.y[row] = self.previous_y[row] = y
+        self.gravity[row] = gravity
+        self.slope[row] = slope
+        self.state[row] = STATE_CODES[state]
+        self.active[row] = True
+        return row
+
+    def remove(self, row):
+        self.active[row] = False
+        self.free_rows.append(row)
+
+    # Snapshots, see GameScene.take_snapshot()
+
+    def snapshot(self):
+        """ Return the rows in use as bytes: a header, the removed rows, then each field's array. """
+        n = self.count
+        data = [ENTITY_SNAPSHOT_HEADER.pack(n, len(self.free_rows)), np.array(self.free_rows, np.int32).tobytes()]
+        data += [getattr(self, name)[:n].tobytes() for name in self.FIELDS]
+        return b''.join(data)
+
+    def restore(self, data, offset=0):
+        """ Go back to a snapshot() read from data at offset. Returns the offset right after it. """
+        n, free_count = ENTITY_SNAPSHOT_HEADER.unpack_from(data, offset)
+        offset += ENTITY_SNAPSHOT_HEADER.size
+        while self.capacity < n:
+            self.grow()
+
+        self.free_rows = np.frombuffer(data, np.int32, free_count, offset).tolist()
+        offset += free_count * 4
+        for name in self.FIELDS:
+            array = getattr(self, name)
+            array[:n] = np.frombuffer(data, array.dtype, n, offset)
+            array[n:self.count] = 0
+            offset += n * array.itemsize
+        self.count = n
+        return offset
+
+    # Physics step, every actor at once. Views over the arrays in use are taken each time,
+    # since growing the store replaces the arrays.
+
+    def begin_step(self):
+        # Remember where everything was, so draws can interpolate, see Scene.interpolate
+        n = self.count
+        self.previous_x[:n] = self.x[:n]
+        self.previous_y[:n] = self.y[:n]
+
+    def apply_ground_speed(self):
+        # http://info.sonicretro.org/SPG:Slope_Physics#Moving_At_Angles
+        # Grounded actors move along the ground at their angle, the sine and cosine come from tables
+        n = self.count
+        grounded = self.active[:n] & self.ground[:n]
+        angle = self.angle[:n]
+        np.multiply(self.ground_speed[:n], COSINE[angle], out=self.x_speed[:n], where=grounded)
+        np.multiply(self.ground_speed[:n], -SINE[angle], out=self.y_speed[:n], where=grounded)
+
+    def apply_movement(self):
+        n = self.count
+        active = self.active[:n]
+        np.add(self.x[:n], self.x_speed[:n], out=self.x[:n], where=active)
+        np.add(self.y[:n], self.y_speed[:n], out=self.y[:n], where=active)
+
+    def apply_patrols(self):
+        # Patrolling actors turn around once they've walked past either end of their patrol
+        n = self.count
+        x = self.x[:n]
+        turning = self.active[:n] & (self.patrol_left[:n] < self.patrol_right[:n])
+        turning &= (x < self.patrol_left[:n]) | (x > self.patrol_right[:n])
+        np.negative(self.x_speed[:n], out=self.x_speed[:n], where=turning)
+
+    def apply_gravity(self):
+        # Only airborne actors fall
+        n = self.count
+        falling = self.active[:n] & ~self.ground[:n]
+        np.add(self.y_speed[:n], self.gravity[:n], out=self.y_speed[:n], where=falling)
+
+    def apply_slope_factors(self):
+        # http://info.sonicretro.org/SPG:Slope_Physics#Slope_Factor
+        # Grounded actors are slowed going up slopes and sped up going down them, at the angle they landed on
+        n = self.count
+        grounded = self.active[:n] & self.ground[:n]
+        np.subtract(self.ground_speed[:n], self.slope[:n] * SINE[self.angle[:n]], out=self.ground_speed[:n],
+                    where=grounded)
+
+    def classify_states(self):
+        """ Pick the state of each grounded actor from its ground speed. Airborne actors keep theirs. """
+        n = self.count
+        speed = np.abs(self.ground_speed[:n])
+        state = self.state[:n]
+        new_state = BAND_STATES[np.searchsorted(SPEED_BANDS, speed)]
+
+        # Exactly at RUN_SPEED or DASH_SPEED, actors keep the state they had
+        changed = self.active[:n] & self.ground[:n] & (new_state != state)
+        changed &= (speed != RUN_SPEED) & (speed != DASH_SPEED)
+
+        # Animations start over when the state changes
+        self.frame_index[:n][changed] = 0
+        state[changed] = new_state[changed]
+
+    def step(self, dt, collide=None):
+        """ Run one physics step. collide(store) is called between moving and gravity,
+            for the actors that check the level with sensors to set their ground flag and angle.
+            Slope factors come last, so they're in the ground speed before the actors' next update. """
+        self.begin_step()
+        self.apply_ground_speed()
+        self.apply_movement()
+        self.apply_patrols()
+        if collide is not None:
+            collide(self)
+        self.apply_gravity()
+        self.apply_slope_factors()
+        self.classify_states()
+
+
+def entity_field(name, kind=float):
+    """ A property reading and writing one field of an actor's row, as a plain Python value.
+        For classes with entities (an EntityStore) and row attributes, like the Player. """
+    def getter(self):
+        return kind(getattr(self.entities, name)[self.row])
+
+    def setter(self, value):
+        getattr(self.entities, name)[self.row] = value
+
+    return property(getter, setter)
+
+
+def entity_state():
+    """ Like entity_field, for the state, which is stored as a number. """
+    def getter(self):
+        return STATES[self.entities.state[self.row]]
+
+    def setter(self, state):
+        self.entities.state[self.row] = STATE_CODES[state]
+
+    return property(getter, setter)
@@ -5,87 +5,156 @@
 # -------------------------------------------------------------------- #
 
 # General imports:
+import struct
 import sys
+import time
 
 # Game related imports:
 import pygame
 import pyscroll
-import pytmx
 from pygame.locals import *
 
 # Local imports:
+from actor_collision import ActorCollisions
+from angles import MODE_NAMES
+from chunk_renderer import LEVEL_RENDERERS, ChunkRenderer
+from collision_grid import CollisionGrid
 from constants import *
+from entities import EntityStore
+from level import LevelMapData, TileImages
+from level_cache import load_level
+from log import get_logger, history as log_history
+from object_spawner import ObjectSpawner
 from player import Player
+from profiler import profiler
 from scene import Scene
-from solid_platform import Platform
+from sensor import detect_sensors
+from text_cache import TextLine, render_text
+
+log = get_logger("game")
+
+# Snapshot header: magic, physics steps run, camera center. See GameScene.take_snapshot()
+SNAPSHOT_HEADER = struct.Struct('<4sIii')
+SNAPSHOT_MAGIC = b'QSNP'
 
 class GameScene(Scene):
-    def __init__(self):
+    # progress(fraction, stage) is told how far loading got, see scene_loader.py
+    # recorder, an InputRecorder, records the player's input, see replay.py
+    # physics overrides the player's physics constants, see player.py
+    # renderer picks how the level is drawn, one of LEVEL_RENDERERS, see chunk_renderer.py
+    def __init__(self, progress=None, recorder=None, physics=None, renderer=LEVEL_RENDERER):
         Scene.__init__(self)
+        if progress is None:
+            progress = lambda fraction, stage: None
 
-        # Set window caption
-        pygame.display.set_caption(WINDOW_CAPTION)
-
-        # TODO: rewrite scenes class to allow resizing of screen globally.
-        # See end paragraph of this article:https://nerdparadise.com/programming/pygame/part7
+        # The level is drawn at the game's native resolution, and scaled up to the window, see display.py
         screen_size = [SCREEN_WIDTH, SCREEN_HEIGHT]
 
-        # List variable for layers - 0 = background color; 1 = scenery; 2 = level; 3 = player; 4 = foreground
-        # Each layer is a seperate surface.
-        self.layers = [pygame.Surface(screen_size) for i in range(4)]
-
         # Create a sprite group of active sprites, which are all rendered in draw() function
         self.active_sprite_list = pygame.sprite.Group()
 
+        # Physics state of every actor, worked out for all of them at once, see entities.py
+        self.entities = EntityStore()
+
         # Create instance of player
-        self.player_one = Player(150, 50, self)
+        progress(0.1, "Loading player")
+        self.player_one = Player(150, 50, self, physics)
+
+        # Make all of the player's mirrored and rotated frames while loading, instead of while playing
+        self.player_one.atlas.prebuild()
 
         # Add player to list of active sprites, so it gets rendered in draw() function
         self.active_sprite_list.add(self.player_one)
 
+        # Actors that touch each other: the player, and the objects around the camera, see actor_collision.py
+        self.actors = ActorCollisions(self.player_one)
+
         # Time to load our TMX level map.
-        self.lvl1_tmx_data = pytmx.load_pygame(LEVEL_01_TMX)
+        # It's compiled to a binary cache the first time, see level_cache.py
+        progress(0.3, "Loading level")
+        self.level = load_level(LEVEL_01_TMX)
+
+        # The level isn't split into chunks that get loaded and dropped around the camera: its layers are
+        # memory-mapped from the cache, so the OS already only pages in the parts that get read, and tile
+        # images are cut once per gid, which the tilesets bound, not the level's size. What does grow with
+        # the level is drawn, and ChunkRenderer keeps that under RENDER_CHUNK_MEMORY, see chunk_renderer.py
+        progress(0.6, "Loading tiles")
+        tile_images = TileImages(self.level)
+
+        # The collision layer as arrays, which the sensors of every actor are checked against, see collision_grid.py
+        self.collision_grid = CollisionGrid(self.level)
 
         # Create new data source for pyscroll
-        self.map_data = pyscroll.data.TiledMapData(self.lvl1_tmx_data)
+        self.map_data = LevelMapData(self.level, tile_images)
 
         # Create new renderer (camera)
         # Clamp_camera is used to prevent the map from scrolling past the edge
-        # TODO: remove screen width/height constants once we get dynamic screen sizes figured out
-        self.map_layer = pyscroll.BufferedRenderer(self.map_data,
-                                                   screen_size,
-                                                   clamp_camera=True)
+        if renderer == 'chunks':
+            self.map_layer = ChunkRenderer(self.map_data, screen_size, clamp_camera=True)
+        elif renderer == 'buffered':
+            self.map_layer = pyscroll.BufferedRenderer(self.map_data,
+                                                       screen_size,
+                                                       clamp_camera=True)
+        else:
+            raise ValueError("Unknown renderer %r, use one of %s" % (renderer, ", ".join(LEVEL_RENDERERS)))
         self.group = pyscroll.PyscrollGroup(map_layer=self.map_layer)
 
-        # TODO: Figure out how to center player in map.
         # TODO: uncomment the following lines of code, and remove/rewrite active_sprite_list
         # For that, see https://github.com/bitcraft/pyscroll/wiki/Tutorial-(WIP)
 
         # Add our player to the group
         self.group.add(self.player_one)
 
+        # Rings, monitors and enemies placed in the level. Only the ones around the camera
+        # exist as sprites, updated and drawn each frame, see object_spawner.py
+        self.object_list = pygame.sprite.Group()
+        self.objects = ObjectSpawner(self.level.objects, self.entities, (self.object_list, self.group, self.actors))
+
+        # The camera follows the player's physics position, and only moves in update(), so which objects
+        # are active never depends on how often the game gets drawn, see follow_player()
+        self.camera = self.view_center = None
+        self.follow_player()
+
+        # Draw the level around the player into the renderer's buffer now, instead of on the first frame
+        progress(0.8, "Drawing level")
+        self.group.center(self.view_center)
+        self.objects.update(self.camera_view())
+
         # Can be switched on with F10 key, for that see events()
         self.debug_mode = False
 
+        # Debug overlay text, see draw_debug()
+        self.debug_text_lines = []
+        self.debug_profiler_lines = []
+        self.debug_frame_count = 0
+        self.debug_log_lines = [TextLine(HUD_FONT, 16, WHITE) for i in range(DEBUG_LOG_LINES)]
+
+        # Camera position and sprite -> (screen rect, image) of each sprite last drawn, see draw()
+        self.drawn_view = None
+        self.drawn_sprites = {}
+
         self.jump_key_pressed = False
 
-        self.platforms = self.get_solid_platforms(self.lvl1_tmx_data.get_layer_by_name("Collision Mask"))
+        # Physics steps run so far, input is recorded by the step it came before
+        self.step_count = 0
+        self.recorder = recorder
 
-    def get_solid_platforms(self, tmx_layer):
-        solid_platforms = []
-        # Least effort involved getting all tile images.
-        # TODO: If we could only check tiles near player's sensors, that might be faster.
-        for x, y, image in tmx_layer.tiles():
-            solid_platforms.append(Platform(x, y, image))
-        return solid_platforms
+        # Snapshot saved with F5 and restored with F9, for retrying from the same spot
+        self.quick_snapshot = None
+
+    def start(self):
+        # Set window caption
+        pygame.display.set_caption(WINDOW_CAPTION)
 
     # Events: processing input from user via keyboard, mouse, etc
     def events(self, events, pressed_keys):
+        if self.recorder is not None:
+            self.recorder.record_events(self.step_count, events)
+
         for event in events:
             if event.type == QUIT:
                 # exit button or quit command issued
-                pygame.quit()
-                sys.exit()
+                self.quit()
             # Key down events
             elif event.type == pygame.KEYDOWN:
                 # Player keypress events
@@ -96,66 +165,262 @@ class GameScene(Scene):
                     self.player_one.advance_animation()
                 # Quit game key
                 elif event.key == pygame.K_ESCAPE:
-                    pygame.quit()
-                    sys.exit()
-                # Turn on debug mode
+                    self.quit()
+                # Turn on debug mode, which also turns on the profiler
                 elif event.key == pygame.K_F10:
                     self.debug_mode = not self.debug_mode
-                    print("Debug mode switched")
+                    profiler.enabled = self.debug_mode
+                    profiler.clear()
+                    log.info("Debug mode switched %s", "on" if self.debug_mode else "off")
+                # Dump the profiled frames to a file
+                elif event.key == pygame.K_F11 and self.debug_mode:
+                    log.info("Profile written to %s", profiler.dump(time.strftime(PROFILE_DUMP_FILE)))
+                # Quick save & restore. Restoring would throw an input recording out of order.
+                elif event.key == pygame.K_F5:
+                    self.quick_snapshot = self.take_snapshot()
+                elif event.key == pygame.K_F9 and self.quick_snapshot is not None:
+                    if self.recorder is None:
+                        self.restore_snapshot(self.quick_snapshot)
+                    else:
+                        log.warning("Can't restore a snapshot while recording input")
 
             # Key up events
             elif event.type == pygame.KEYUP:
                 # Player key release events
                 self.player_one.key_release(event, pressed_keys)
 
+    # Save the input recording, if there is one, and leave
+    def quit(self):
+        if self.recorder is not None:
+            self.recorder.save()
+        pygame.quit()
+        sys.exit()
+
     # game logic/mechanics here. process user input
     def update(self, dt):
 
         # Update active sprite group
-        self.active_sprite_list.update(dt)
-
-    # Code for what is drawn on screen each frame here
-    def draw(self, screen, surface):
-        # Clear screen/fill with background color
-        surface.fill(GAME_BG_COLOR)
-
-        # Draw sprite / level data group to surface
-        self.group.draw(surface)
-
-        # Debug mode rendering logic
-        if self.debug_mode:
-            self.draw_debug(screen, surface)
-
-        # Draw/render surface onto screen
-        screen.blit(surface, (0, 0))
+        with profiler.section("physics: animation"):
+            self.active_sprite_list.update(dt)
+
+        # Move every actor, let the ones with sensors find the ground, then apply gravity and pick states
+        with profiler.section("physics: entities"):
+            self.entities.step(dt, self.collide_actors)
+
+        for sprite in self.active_sprite_list:
+            sprite.update_image()
+
+        # Only the objects around the camera
+        with profiler.section("physics: objects"):
+            self.object_list.update(dt)
+
+        # Actors touching each other: rings collected, enemies beaten...
+        with profiler.section("physics: actors"):
+            self.actors.step()
+
+        self.step_count += 1
+        if self.recorder is not None:
+            self.recorder.record_step(self.step_count, self.player_one)
+
+        # Keep the camera on the player, then bring the objects around it to life
+        self.follow_player()
+        with profiler.section("objects: activation"):
+            self.objects.update(self.camera_view())
+
+    def follow_player(self):
+        """ Move the camera to the center of the player's rect at its physics position. """
+        player = self.player_one
+        self.camera = (int(player.x) + player.rect.width // 2, int(player.y) + player.rect.height // 2)
+        # Drawn from here until interpolate() says otherwise
+        self.view_center = self.camera
+
+    def camera_view(self):
+        """ The part of the level the camera shows, kept inside the level like the renderer keeps it. """
+        view = pygame.Rect(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT)
+        view.center = self.camera
+        return view.clamp(self.map_layer.map_rect)
+
+    # Snapshots: everything the simulation changes as it runs, in a few hundred bytes.
+    # Restoring goes back to that moment without touching the level, for retries, rewinding
+    # or rolling back and simulating again. Only restore snapshots taken in the same level.
+    def take_snapshot(self):
+        camera_x, camera_y = self.camera
+        data = [SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, self.step_count, camera_x, camera_y), self.entities.snapshot()]
+        data += [sprite.snapshot() for sprite in self.active_sprite_list]
+        data.append(self.objects.snapshot())
+        return b''.join(data)
+
+    def restore_snapshot(self, data):
+        magic, self.step_count, camera_x, camera_y = SNAPSHOT_HEADER.unpack_from(data)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError("Not a game scene snapshot")
+        # The objects give their rows back first, they take over the snapshot's rows once it's restored
+        self.objects.clear()
+        offset = self.entities.restore(data, SNAPSHOT_HEADER.size)
+        for sprite in self.active_sprite_list:
+            offset = sprite.restore(data, offset)
+        self.objects.restore(data, offset)
+        self.camera = self.view_center = (camera_x, camera_y)
+
+    # Called by the entity store between moving and gravity.
+    # The sensors of every actor are checked against the level in a single call.
+    def collide_actors(self, entities):
+        with profiler.section("physics: sensors"):
+            sensors = []
+            for sprite in self.active_sprite_list:
+                sprite.move_sensors()
+                sensors.extend(sprite.sensors)
+            detect_sensors(sensors, self.collision_grid)
+
+            for sprite in self.active_sprite_list:
+                sprite.collide()
+
+    # Draw sprites between their last two physics positions.
+    # The camera is on the player, so it's drawn centered on where the player is drawn.
+    def interpolate(self, alpha):
+        for sprite in self.active_sprite_list:
+            sprite.interpolate(alpha)
+        self.view_center = self.player_one.rect.center
+
+    # Code for what is drawn on screen each frame here.
+    # While the camera stands still, only the parts of the screen the sprites moved over are shown again.
+    def draw(self, screen):
+        # Show what the camera sees, it's moved by update()
+        self.group.center(self.view_center)
+
+        view = self.map_layer.view_rect.topleft
+        sprites = dict((sprite, (self.map_layer.translate_rect(sprite.rect), sprite.image)) for sprite in self.group)
+        # Animated tiles change on their own, so the whole view is drawn again in levels that have them
+        camera_still = (view == self.drawn_view and not self.redraw_all and not self.debug_mode
+                        and not self.level.animations)
+
+        if camera_still:
+            # Only where sprites were and where they are now is drawn again,
+            # objects come and go too as the camera moves, or when a snapshot is restored
+            changed = []
+            for sprite, drawn in self.drawn_sprites.items():
+                current = sprites.get(sprite)
+                if current != drawn:
+                    changed.append(drawn[0] if current is None else drawn[0].union(current[0]))
+            changed += [current[0] for sprite, current in sprites.items() if sprite not in self.drawn_sprites]
+
+            screen_rect = screen.get_rect()
+            dirty_rects = [rect.clip(screen_rect) for rect in changed]
+            dirty_rects = [rect for rect in dirty_rects if rect.width and rect.height]
+            with profiler.section("draw: map"):
+                for rect in dirty_rects:
+                    self.draw_area(screen, rect)
+        else:
+            # Clear screen/fill with background color
+            screen.fill(GAME_BG_COLOR)
+
+            # Draw sprite / level data group straight onto the screen
+            with profiler.section("draw: map"):
+                self.group.draw(screen)
+            dirty_rects = None
+
+        self.drawn_view, self.drawn_sprites = view, sprites
+        # The debug overlay (see draw_overlay) changes every frame, and has to be cleared off once it's turned off
+        self.redraw_all = self.debug_mode
+        return dirty_rects
+
+    def draw_area(self, screen, rect):
+        """ Draw the level and sprites again on one rect of the screen, and nowhere else. """
+        # The renderer lines the view up with the area it's given, and clips to it. Handing it the rect
+        # as a subsurface, with the area moved back to the screen's corner, draws the view where it was
+        area = screen.subsurface(rect)
+        area.fill(GAME_BG_COLOR)
+        center_x, center_y = self.map_layer.get_center_offset()
+        offset_x, offset_y = center_x - rect.x, center_y - rect.y
+
+        # Only the sprites over the rect, in the order the group draws them
+        level_rect = rect.move(-center_x, -center_y)
+        layer_of = self.group.get_layer_of_sprite
+        surfaces = [(sprite.image, sprite.rect.move(offset_x, offset_y), layer_of(sprite))
+                    for sprite in self.group.sprites() if sprite.rect.colliderect(level_rect)]
+        self.map_layer.draw(area, pygame.Rect((-rect.x, -rect.y), screen.get_size()), surfaces)
+
+    # Debug mode rendering logic, drawn on the window so the text stays readable at any resolution
+    def draw_overlay(self, window, display):
+        if not self.debug_mode:
+            return False
+        with profiler.section("draw: debug"):
+            self.draw_debug(window, display)
+        return True
 
     # All this function's code could just be put into the draw() function,
     # but I put it here because I'm tired of scrolling over it.
-    # TODO: rewrite debug drawing code so all text in in a list that is displayed within a for loop.
-    # TODO: that way we can add more debug outputs easily by appending them to the list
-    def draw_debug(self, screen, surface):
-        screen.fill(TITLE_BG_COLOR)
-
-        # Make small font
-        debugFont = pygame.font.Font(HUD_FONT, 20)
-
+    # Debug text is a list of lines, add more debug outputs by appending to it.
+    def draw_debug(self, surface, display):
         # Create instances of text
-        debugText = debugFont.render("Debug mode", False, WHITE)
-        positionText = debugFont.render("Player X,Y: %s,%s" %
-                                        (self.player_one.rect.x, self.player_one.rect.y), False, WHITE)
-        speedText = debugFont.render("XSP, YSP: %s,%s" %
-                                        (self.player_one.x_speed, self.player_one.y_speed), False, WHITE)
-        playerstateText = debugFont.render("State: %s" % self.player_one._state, False, WHITE)
-
-        # Render the debug text
-        surface.blit(debugText, (5, 5))
-        surface.blit(positionText, (20, 35))
-        surface.blit(speedText, (20, 65))
-        surface.blit(playerstateText, (20, 95))
-
-        # Render the sensors
+        lines = [
+            "Player X,Y: %s,%s" % (self.player_one.rect.x, self.player_one.rect.y),
+            "XSP, YSP: %s,%s" % (self.player_one.x_speed, self.player_one.y_speed),
+            "State: %s, GSP: %.2f, angle: %d (%s)" % (self.player_one._state, self.player_one.ground_speed,
+                                                      self.player_one.angle, MODE_NAMES[self.player_one.mode]),
+            "Objects: %d active of %d, rings: %d" % (len(self.objects.active), len(self.objects.objects),
+                                                      self.player_one.rings),
+        ]
+
+        # The profiler's numbers change every frame, so they're only refreshed every so often
+        self.debug_frame_count += 1
+        if self.debug_frame_count % DEBUG_PROFILER_REFRESH == 1 or not self.debug_profiler_lines:
+            self.debug_profiler_lines = self.get_profiler_lines()
+        lines += self.debug_profiler_lines
+
+        # Render the debug text. Lines are only re-rendered when their text changed, see text_cache.py
+        surface.blit(render_text(HUD_FONT, 20, "Debug mode", WHITE), (5, 5))
+        while len(self.debug_text_lines) < len(lines):
+            self.debug_text_lines.append(TextLine(HUD_FONT, 20, WHITE))
+        for i, (line, text_line) in enumerate(zip(lines, self.debug_text_lines)):
+            # Player and object lines are 30px apart, the profiler's 22px
+            y = 35 + 30 * i if i < 4 else 155 + 22 * (i - 4)
+            surface.blit(text_line.render(line), (20, y))
+
+        # Render the sensors, moved from level coordinates to the camera's, then to the window's
         for sensor in self.player_one.sensors:
+            sensor_rect = display.to_window(self.map_layer.translate_rect(sensor.rect))
             if sensor.activated:
-                pygame.draw.rect(surface, sensor.active_color, sensor)
+                pygame.draw.rect(surface, sensor.active_color, sensor_rect)
             else:
-                pygame.draw.rect(surface, sensor.inactive_color, sensor)
+                pygame.draw.rect(surface, sensor.inactive_color, sensor_rect)
+
+        self.draw_profiler_graph(surface)
+
+        # Latest log messages along the bottom left, see log.py
+        messages = list(log_history)[-DEBUG_LOG_LINES:]
+        y = surface.get_height() - 5 - 18 * len(messages)
+        for (seconds, level, category, message), text_line in zip(messages, self.debug_log_lines):
+            surface.blit(text_line.render("%s: %s" % (category, message)), (5, y))
+            y += 18
+
+    # The average time of each profiled section, see profiler.py
+    def get_profiler_lines(self):
+        frame_times = profiler.frame_times()
+        if not frame_times:
+            return []
+
+        # Per section breakdown, slowest first
+        lines = ["Frame: %.2fms avg, %.2fms max" % (sum(frame_times) / len(frame_times), max(frame_times))]
+        lines += ["%s: %.2fms" % section for section in profiler.averages()]
+        return lines
+
+    # Frame time graph
+    def draw_profiler_graph(self, surface):
+        frame_times = profiler.frame_times()
+        if not frame_times:
+            return
+
+        # One bar per frame along the bottom right, red when the frame went over budget
+        graph = pygame.Rect(0, 0, PROFILER_GRAPH_SIZE[0], PROFILER_GRAPH_SIZE[1])
+        graph.bottomright = (surface.get_width() - 5, surface.get_height() - 5)
+        scale = graph.height / (2 * PHYSICS_STEP)
+        pygame.draw.rect(surface, BLACK, graph)
+        for i, frame_time in enumerate(frame_times[-graph.width:]):
+            height = min(int(frame_time * scale), graph.height)
+            color = GREEN if frame_time <= PHYSICS_STEP else RED
+            pygame.draw.line(surface, color, (graph.x + i, graph.bottom - 1), (graph.x + i, graph.bottom - height))
+
+        # Frame budget line
+        budget_y = graph.bottom - int(PHYSICS_STEP * scale)
+        pygame.draw.line(surface, YELLOW, (graph.x, budget_y), (graph.right - 1, budget_y))
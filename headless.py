@@ -0,0 +1,65 @@
+# -------------------------------------------------------------------- #
+# headless.py
+#   runs the game simulation without a window: levels, players and
+#   collision are loaded as usual, and Scene.update is stepped as fast
+#   as possible without ever drawing. Used for physics regression runs
+#   and throughput measurements on machines without a screen.
+#
+#   Modules that load images when imported, like game.py, have to be
+#   imported after init_headless(), so the ones that run scenes import
+#   them inside functions. Without a window, images can't be converted
+#   to the display's pixel format and are used as loaded instead.
+#
+#   python main.py --headless 10000
+# -------------------------------------------------------------------- #
+
+# General imports:
+import os
+import time
+
+# Game library imports:
+import pygame
+
+# Local imports:
+from constants import *
+
+
+def init_headless():
+    """ Initialize pygame without opening a window. Must be called before anything loads images. """
+    # SDL's dummy video driver needs no display server
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    pygame.init()
+
+
+def step_scene(scene, steps, pressed_keys=None):
+    """ Run a scene for a number of fixed physics steps, with no input and no drawing. """
+    if pressed_keys is None:
+        pressed_keys = pygame.key.get_pressed()
+    for _ in range(steps):
+        scene.events([], pressed_keys)
+        scene.update(PHYSICS_STEP)
+    return scene
+
+
+def run_headless(steps, scene_class=None):
+    """ Load a scene without a display, and step it as fast as possible.
+        Returns how long loading and simulating took, in seconds. """
+    init_headless()
+
+    if scene_class is None:
+        # Only now that pygame is initialized, see the top of this file
+        from game import GameScene
+        scene_class = GameScene
+
+    start = time.perf_counter()
+    scene = scene_class()
+    scene.start()
+    loaded = time.perf_counter()
+    step_scene(scene, steps)
+    finished = time.perf_counter()
+
+    load_time, run_time = loaded - start, finished - loaded
+    print("Loaded in %.3fs, simulated %d steps in %.3fs (%.0f steps per second)"
+          % (load_time, steps, run_time, steps / run_time if run_time else float('inf')))
+    return load_time, run_time
@@ -0,0 +1,102 @@
+# -------------------------------------------------------------------- #
+# height_mask.py
+#   height & width arrays of collision tiles
+#   see http://info.sonicretro.org/SPG:Solid_Tiles#Height_Masks
+# -------------------------------------------------------------------- #
+
+# General imports
+import math
+
+# Game library imports
+import pygame
+
+# Local imports
+from angles import FLAT_ANGLE, degrees_to_angle
+from constants import *
+
+
+class HeightMask(object):
+    """ The 16 column heights and 16 row widths of one collision tile.
+
+        heights[x] is how many pixels of column x are solid, measured from the
+        bottom of the tile. A negative value means the column is solid from the top
+        instead (like a ceiling), and 0 means the column is empty.
+
+        widths[y] is the same thing for row y, measured from the right of the tile.
+        A negative value means the row is solid from the left instead.
+
+        angle is the angle of the tile's surface, in steps of angles.py, worked out once from the rest.
+        Full tiles have FLAT_ANGLE instead, they're flat from whichever side they're looked at. """
+
+    def __init__(self, heights, widths):
+        self.heights = tuple(heights)
+        self.widths = tuple(widths)
+        self.angle = surface_angle(self.heights, self.widths)
+
+    @classmethod
+    def from_image(cls, image):
+        """ Work out the height and width arrays of a collision tile image.
+            In the collision mask, red is the background color, anything else is solid. """
+        width, height = image.get_size()
+
+        # Pixels matching the background color are set in this mask, so invert it
+        solid = pygame.mask.from_threshold(image, MASK_BG_COLOR, (1, 1, 1, 255))
+        solid.invert()
+
+        heights = []
+        for x in range(width):
+            column = [solid.get_at((x, y)) for y in range(height)]
+            heights.append(_solid_run(column))
+
+        widths = []
+        for y in range(height):
+            row = [solid.get_at((x, y)) for x in range(width)]
+            widths.append(_solid_run(row))
+
+        return cls(heights, widths)
+
+
+def surface_angle(heights, widths):
+    """ Angle of a tile's surface, in steps of angles.py, from its height and width arrays: the slope between
+        the first and last solid columns of floors and ceilings, or rows of walls. Angles go the way
+        the player runs along the surface, with the solid side below them, so a flat ceiling is 128.
+        Full and empty tiles are FLAT_ANGLE, they have no surface of their own. """
+    # Columns of different heights make a floor or ceiling, rows of different widths a wall
+    partial_columns = [height for height in heights if 0 < abs(height) < len(widths)]
+    partial_rows = [width for width in widths if 0 < abs(width) < len(heights)]
+    if not partial_columns and not partial_rows:
+        return FLAT_ANGLE
+    floor_or_ceiling = len(partial_columns) >= len(partial_rows)
+    runs = heights if floor_or_ceiling else widths
+    side = 1 if (partial_columns if floor_or_ceiling else partial_rows)[0] > 0 else -1
+
+    # Solid runs on that side, from the first to the last of them
+    solid = [(i, run * side) for i, run in enumerate(runs) if run * side > 0]
+    (first, first_run), (last, last_run) = solid[0], solid[-1]
+    along, rise = max(last - first, 1), last_run - first_run
+
+    if floor_or_ceiling:
+        # Floors are run along to the right, ceilings to the left
+        radians = math.atan2(rise, along * side)
+    else:
+        # Walls on the right are run up, walls on the left down
+        radians = math.atan2(along * side, rise)
+    return degrees_to_angle(math.degrees(radians))
+
+
+def _solid_run(pixels):
+    # Count the solid pixels touching the far end (bottom/right) of a column/row,
+    # or, negated, the ones touching the near end (top/left) if the far end is empty.
+    run = 0
+    for pixel in reversed(pixels):
+        if not pixel:
+            break
+        run += 1
+    if run:
+        return run
+
+    for pixel in pixels:
+        if not pixel:
+            break
+        run -= 1
+    return run
@@ -0,0 +1,218 @@
+# -------------------------------------------------------------------- #
+# level.py
+#   level data (tile gid grids, tile images, collision height masks,
+#   placed objects), and a pyscroll data source that renders it
+# -------------------------------------------------------------------- #
+
+# Game related imports:
+import pygame
+import pyscroll
+
+# Local imports:
+from constants import *
+
+# Tile flag bits, as stored in the tile table
+TILE_FLIPPED_HORIZONTALLY = 1
+TILE_FLIPPED_VERTICALLY = 2
+TILE_FLIPPED_DIAGONALLY = 4
+
+# Number of values per gid in the tile table: image index, x, y, width, height, flags
+TILE_TABLE_STRIDE = 6
+
+
+class LevelLayer(object):
+    """ One tile layer of a level: a flat, row-major grid of tile gids. """
+
+    def __init__(self, name, visible, width, height, data):
+        self.name = name
+        self.visible = visible
+        self.width = width
+        self.height = height
+
+        # Any sequence of ints works here, the level cache hands over memory-mapped arrays
+        self.data = data
+
+    def get(self, x, y):
+        """ Return the gid at a grid position, 0 if empty or outside of the layer. """
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return self.data[y * self.width + x]
+        return 0
+
+    def row(self, y):
+        return self.data[y * self.width:(y + 1) * self.width]
+
+
+class LevelObject(object):
+    """ An object placed in one of the level's Tiled object layers: a ring, a monitor, an enemy...
+        type says which, see objects.py. Position and size are in pixels, properties are Tiled's custom ones. """
+
+    def __init__(self, object_id, object_type, name, x, y, width, height, properties=None):
+        self.id = object_id
+        self.type = object_type
+        self.name = name
+        self.x, self.y = x, y
+        self.width, self.height = width, height
+        self.properties = properties or {}
+
+    @property
+    def rect(self):
+        return pygame.Rect(int(self.x), int(self.y), max(int(self.width), 1), max(int(self.height), 1))
+
+
+class LevelObjectLayer(object):
+    """ One object layer of a level. """
+
+    def __init__(self, name, visible, objects):
+        self.name = name
+        self.visible = visible
+        self.objects = objects
+
+
+class Level(object):
+    """ Everything the engine needs from a TMX level, without the XML. """
+
+    def __init__(self, filename, width, height, tile_size, layers, image_sources,
+                 tile_table, height_masks, animations=None, object_layers=None):
+        self.filename = filename
+
+        # Size of the map in tiles, and of each tile in pixels
+        self.width = width
+        self.height = height
+        self.tile_width, self.tile_height = tile_size
+
+        # Tile layers, in drawing order
+        self.layers = layers
+        self.layernames = dict((layer.name, layer) for layer in layers)
+
+        # (image path, colorkey) of every tileset image
+        self.image_sources = image_sources
+
+        # TILE_TABLE_STRIDE ints per gid, saying where to find the gid's image
+        self.tile_table = tile_table
+
+        # gid -> HeightMask, for every gid used in the collision layer
+        self.height_masks = height_masks
+
+        # gid -> [(frame gid, duration in ms), ...]
+        self.animations = animations or {}
+
+        # Object layers, with the objects placed in them
+        self.object_layers = object_layers or []
+
+    def get_layer_by_name(self, name):
+        return self.layernames[name]
+
+    @property
+    def tile_count(self):
+        return len(self.tile_table) // TILE_TABLE_STRIDE
+
+    @property
+    def objects(self):
+        """ Every placed object, from every object layer. """
+        return [level_object for layer in self.object_layers for level_object in layer.objects]
+
+    @property
+    def visible_tile_layers(self):
+        return [index for index, layer in enumerate(self.layers) if layer.visible]
+
+
+class TileImages(object):
+    """ Loads each tileset image once, and cuts tile images out of it the first time a gid is asked for. """
+
+    def __init__(self, level):
+        self.level = level
+        self.sources = [None] * len(level.image_sources)
+        self.images = [None] * level.tile_count
+
+    def get_source(self, index):
+        source = self.sources[index]
+        if source is None:
+            path, colorkey = self.level.image_sources[index]
+            source = pygame.image.load(path)
+            # Tilesets stay in their file's pixel format when there's no window, see headless.py
+            if pygame.display.get_surface() is not None:
+                source = source.convert_alpha() if colorkey is None else source.convert()
+            if colorkey is not None:
+                source.set_colorkey(pygame.Color(colorkey), pygame.RLEACCEL)
+            self.sources[index] = source
+        return source
+
+    def get(self, gid):
+        """ Return the image of a gid, or None if it has none. """
+        image = self.images[gid]
+        if image is None and gid:
+            offset = gid * TILE_TABLE_STRIDE
+            source_index, x, y, width, height, flags = self.level.tile_table[offset:offset + TILE_TABLE_STRIDE]
+            if source_index < 0:
+                return None
+            image = self.get_source(source_index).subsurface((x, y, width, height))
+            if flags & TILE_FLIPPED_DIAGONALLY:
+                image = pygame.transform.flip(pygame.transform.rotate(image, 270), True, False)
+            if flags & (TILE_FLIPPED_HORIZONTALLY | TILE_FLIPPED_VERTICALLY):
+                image = pygame.transform.flip(image, bool(flags & TILE_FLIPPED_HORIZONTALLY),
+                                              bool(flags & TILE_FLIPPED_VERTICALLY))
+            self.images[gid] = image
+        return image
+
+
+class LevelMapData(pyscroll.data.PyscrollDataAdapter):
+    """ pyscroll data source for a Level, so the renderer doesn't need pytmx. """
+
+    def __init__(self, level, tile_images=None):
+        super().__init__()
+        self.level = level
+        self.tile_images = tile_images or TileImages(level)
+        self.reload_animations()
+
+    def reload_data(self):
+        pass
+
+    def get_animations(self):
+        return self.level.animations.items()
+
+    def convert_surfaces(self, parent, alpha=False):
+        pass
+
+    @property
+    def tile_size(self):
+        return self.level.tile_width, self.level.tile_height
+
+    @property
+    def map_size(self):
+        return self.level.width, self.level.height
+
+    @property
+    def visible_tile_layers(self):
+        return self.level.visible_tile_layers
+
+    def _get_tile_image(self, x, y, l):
+        return self.tile_images.get(self.level.layers[l].get(x, y))
+
+    def _get_tile_image_by_id(self, id):
+        return self.tile_images.get(id)
+
+    def get_tile_images_by_rect(self, rect):
+        x1, y1, x2, y2 = pyscroll.common.rect_to_bb(rect)
+        x1, y1 = max(x1, 0), max(y1, 0)
+        x2, y2 = min(x2, self.level.width - 1), min(y2, self.level.height - 1)
+
+        get_image = self.tile_images.get
+        animated_tile = self._animated_tile
+        track = bool(self._animation_queue)
+        tracked_gids = self._tracked_gids
+        animation_map = self._animation_map
+
+        for l in self.visible_tile_layers:
+            layer = self.level.layers[l]
+            for y in range(y1, y2 + 1):
+                row = layer.row(y)
+                for x in range(x1, x2 + 1):
+                    gid = row[x]
+                    if not gid:
+                        continue
+                    # since the tile has been queried, it needs checking for animations later on
+                    if track and gid in tracked_gids:
+                        animation_map[gid].positions.add((x, y, l))
+                    tile = animated_tile.get((x, y, l)) or get_image(gid)
+                    if tile:
+                        yield x, y, l, tile
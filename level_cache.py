@@ -0,0 +1,309 @@
+# -------------------------------------------------------------------- #
+# level_cache.py
+#   compiles TMX levels into a binary file next to them, so loading a
+#   level is memory-mapping a few arrays instead of parsing XML.
+#   The cache is rebuilt whenever the TMX file, or any tileset or image
+#   it uses, changes.
+#
+#   To compile levels ahead of time:
+#       python level_cache.py assets/levels/ghz1.tmx
+# -------------------------------------------------------------------- #
+
+# General imports:
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+# Local imports:
+from constants import *
+from height_mask import HeightMask
+from level import (Level, LevelLayer, LevelObject, LevelObjectLayer, TileImages, TILE_FLIPPED_DIAGONALLY,
+                   TILE_FLIPPED_HORIZONTALLY, TILE_FLIPPED_VERTICALLY, TILE_TABLE_STRIDE)
+
+# Cache files live next to the TMX file, with this extension
+LEVEL_CACHE_EXTENSION = '.qlvl'
+
+# Bump this whenever the file layout changes, older caches are then rebuilt
+LEVEL_CACHE_VERSION = 3
+
+# magic, version, byte order, TMX mtime (ns), TMX size, TMX sha1, metadata length
+HEADER = struct.Struct('<4sHHqq20sI')
+MAGIC = b'QLVL'
+BYTE_ORDER = {'little': 0, 'big': 1}[sys.byteorder]
+
+# Arrays in the file are aligned to this many bytes
+ALIGNMENT = 8
+
+
+def get_cache_path(tmx_path):
+    return os.path.splitext(tmx_path)[0] + LEVEL_CACHE_EXTENSION
+
+
+def _hash_file(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).digest()
+
+
+def _dependencies(tmx_path, image_paths):
+    """ Every file compiling a TMX file reads besides itself, its external tilesets and their images,
+        as [path relative to the TMX file's folder, mtime (ns), size, sha1 as hex]. """
+    import xml.etree.ElementTree as ElementTree
+
+    folder = os.path.dirname(tmx_path)
+    paths = [os.path.join(folder, tileset.get('source'))
+             for tileset in ElementTree.parse(tmx_path).getroot().iter('tileset') if tileset.get('source')]
+    dependencies = []
+    for path in sorted(set(os.path.normpath(path) for path in paths + list(image_paths))):
+        stat = os.stat(path)
+        dependencies.append([os.path.relpath(path, folder), stat.st_mtime_ns, stat.st_size, _hash_file(path).hex()])
+    return dependencies
+
+
+def compile_level(tmx_path, cache_path=None):
+    """ Parse a TMX file and write it out as a level cache. Returns the cache's path. """
+    # Only needed for compiling, loading a cached level never touches pytmx
+    import pytmx
+
+    cache_path = cache_path or get_cache_path(tmx_path)
+    tmx_data = pytmx.TiledMap(tmx_path)
+
+    # Images of the tilesets, and where each gid's image is in them.
+    # Without an image loader pytmx leaves (path, rect, flags) for every gid.
+    image_sources = []
+    image_indexes = {}
+    colorkeys = dict((os.path.normpath(os.path.join(os.path.dirname(tmx_path), tileset.source)), tileset.trans)
+                     for tileset in tmx_data.tilesets)
+    tile_table = array('i', [-1, 0, 0, 0, 0, 0] * len(tmx_data.images))
+    for gid, entry in enumerate(tmx_data.images):
+        if not entry:
+            continue
+        path, rect, tile_flags = entry
+        path = os.path.normpath(path)
+        if path not in image_indexes:
+            image_indexes[path] = len(image_sources)
+            colorkey = colorkeys.get(path)
+            image_sources.append((path, '#' + colorkey if colorkey else None))
+        flags = ((TILE_FLIPPED_HORIZONTALLY if tile_flags.flipped_horizontally else 0) |
+                 (TILE_FLIPPED_VERTICALLY if tile_flags.flipped_vertically else 0) |
+                 (TILE_FLIPPED_DIAGONALLY if tile_flags.flipped_diagonally else 0))
+        offset = gid * TILE_TABLE_STRIDE
+        tile_table[offset:offset + TILE_TABLE_STRIDE] = array('i', [image_indexes[path]] + list(rect) + [flags])
+
+    layers = []
+    object_layers = []
+    for tmx_layer in tmx_data.layers:
+        if isinstance(tmx_layer, pytmx.TiledTileLayer):
+            data = array('I', (gid for row in tmx_layer.data for gid in row))
+            layers.append(LevelLayer(tmx_layer.name, bool(tmx_layer.visible),
+                                     tmx_layer.width, tmx_layer.height, data))
+        elif isinstance(tmx_layer, pytmx.TiledObjectGroup):
+            object_layers.append(LevelObjectLayer(tmx_layer.name, bool(tmx_layer.visible),
+                                                  [_level_object(tmx_object) for tmx_object in tmx_layer]))
+
+    animations = {}
+    for gid, properties in tmx_data.tile_properties.items():
+        frames = properties.get('frames')
+        if frames:
+            animations[gid] = [(frame.gid, frame.duration) for frame in frames]
+
+    level = Level(tmx_path, tmx_data.width, tmx_data.height, (tmx_data.tilewidth, tmx_data.tileheight),
+                  layers, image_sources, tile_table, {}, animations, object_layers)
+
+    # Height masks of every gid in the collision layer
+    if COLLISION_LAYER in level.layernames:
+        tile_images = TileImages(level)
+        for gid in sorted(set(level.get_layer_by_name(COLLISION_LAYER).data) - {0}):
+            image = tile_images.get(gid)
+            if image is not None:
+                level.height_masks[gid] = HeightMask.from_image(image)
+
+    write_level(level, tmx_path, cache_path, _dependencies(tmx_path, [path for path, colorkey in image_sources]))
+    return cache_path
+
+
+def _level_object(tmx_object):
+    # The object's type is its class in newer versions of Tiled, objects without one go by their name
+    object_type = getattr(tmx_object, 'type', None) or getattr(tmx_object, 'class', None) or tmx_object.name
+    # Only properties the cache's JSON can hold, colors and such are kept as text
+    properties = dict((key, value if isinstance(value, (bool, int, float, str)) else str(value))
+                      for key, value in tmx_object.properties.items())
+    return LevelObject(tmx_object.id, object_type, tmx_object.name, tmx_object.x, tmx_object.y,
+                       tmx_object.width, tmx_object.height, properties)
+
+
+def write_level(level, tmx_path, cache_path, dependencies=()):
+    """ Write a Level out to a cache file, stamped with the TMX file it came from
+        and the other files it was compiled from, see _dependencies(). """
+    arrays = []
+
+    def add_array(values):
+        arrays.append(values)
+        return len(arrays) - 1
+
+    gids = sorted(level.height_masks)
+    tables = array('b')
+    for gid in gids:
+        tables.extend(level.height_masks[gid].heights)
+        tables.extend(level.height_masks[gid].widths)
+
+    metadata = {
+        'width': level.width,
+        'height': level.height,
+        'tile_size': [level.tile_width, level.tile_height],
+        # Paths relative to the TMX file, so the cache works from wherever the game is started
+        'image_sources': [[os.path.relpath(path, os.path.dirname(tmx_path)), colorkey]
+                          for path, colorkey in level.image_sources],
+        'tile_table': add_array(array('i', level.tile_table)),
+        'layers': [{'name': layer.name, 'visible': layer.visible,
+                    'width': layer.width, 'height': layer.height,
+                    'data': add_array(array('I', layer.data))} for layer in level.layers],
+        'height_mask_gids': add_array(array('I', gids)),
+        'height_mask_tables': add_array(tables),
+        'animations': [[gid, frames] for gid, frames in level.animations.items()],
+        'dependencies': list(dependencies),
+        'object_layers': [{'name': layer.name, 'visible': layer.visible,
+                           'objects': [[level_object.id, level_object.type, level_object.name,
+                                        level_object.x, level_object.y, level_object.width, level_object.height,
+                                        level_object.properties] for level_object in layer.objects]}
+                          for layer in level.object_layers],
+    }
+
+    # Work out where each array goes, after the header and the metadata
+    def align(position):
+        return (position + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+    # The metadata stores array offsets, which depend on the metadata's own length
+    # so lay it out with placeholder offsets first, then again once they're known.
+    offsets = None
+    new_offsets = [0] * len(arrays)
+    while offsets != new_offsets:
+        offsets = new_offsets
+        metadata['arrays'] = [[offsets[i], arrays[i].typecode, len(arrays[i])] for i in range(len(arrays))]
+        encoded = json.dumps(metadata).encode('utf-8')
+        position = align(HEADER.size + len(encoded))
+        new_offsets = []
+        for values in arrays:
+            new_offsets.append(position)
+            position = align(position + len(values) * values.itemsize)
+
+    stat = os.stat(tmx_path)
+    header = HEADER.pack(MAGIC, LEVEL_CACHE_VERSION, BYTE_ORDER,
+                         stat.st_mtime_ns, stat.st_size, _hash_file(tmx_path), len(encoded))
+
+    # Write to a temporary file first, so a half written cache never gets loaded
+    temporary_path = cache_path + '.tmp'
+    with open(temporary_path, 'wb') as f:
+        f.write(header)
+        f.write(encoded)
+        for i, values in enumerate(arrays):
+            f.write(b'\0' * (offsets[i] - f.tell()))
+            values.tofile(f)
+    os.replace(temporary_path, cache_path)
+
+
+def is_cache_valid(tmx_path, cache_path):
+    """ True if the cache exists and was compiled from the TMX file, its tilesets and their images as they are now. """
+    try:
+        with open(cache_path, 'rb') as f:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                return False
+            magic, version, byte_order, mtime_ns, size, digest, metadata_length = HEADER.unpack(header)
+            if magic != MAGIC or version != LEVEL_CACHE_VERSION or byte_order != BYTE_ORDER:
+                return False
+            encoded = f.read(metadata_length)
+    except OSError:
+        return False
+
+    # Checking the modification time is enough most of the time,
+    # only hash a file when it was touched (e.g. by a git checkout)
+    touched = False
+    stat = os.stat(tmx_path)
+    if stat.st_mtime_ns != mtime_ns or stat.st_size != size:
+        if stat.st_size != size or _hash_file(tmx_path) != digest:
+            return False
+        mtime_ns, touched = stat.st_mtime_ns, True
+
+    metadata = json.loads(encoded.decode('utf-8'))
+    folder = os.path.dirname(tmx_path)
+    for dependency in metadata['dependencies']:
+        path, dependency_mtime_ns, dependency_size, dependency_digest = dependency
+        try:
+            stat = os.stat(os.path.join(folder, path))
+        except OSError:
+            return False
+        if stat.st_mtime_ns == dependency_mtime_ns and stat.st_size == dependency_size:
+            continue
+        if stat.st_size != dependency_size or _hash_file(os.path.join(folder, path)).hex() != dependency_digest:
+            return False
+        dependency[1], touched = stat.st_mtime_ns, True
+
+    # Same contents, remember the new modification times so the next load doesn't hash them again.
+    # The metadata is only rewritten if it keeps its length, the arrays after it can't move.
+    if touched:
+        rewritten = json.dumps(metadata).encode('utf-8')
+        try:
+            with open(cache_path, 'r+b') as f:
+                f.write(HEADER.pack(magic, version, byte_order, mtime_ns, size, digest, metadata_length))
+                if len(rewritten) == metadata_length:
+                    f.write(rewritten)
+        except OSError:
+            pass
+    return True
+
+
+def read_level(tmx_path, cache_path):
+    """ Memory-map a level cache and return its Level. The arrays are views into the mapped file. """
+    with open(cache_path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    buffer = memoryview(mapped)
+    metadata_length = HEADER.unpack_from(buffer)[-1]
+    metadata = json.loads(bytes(buffer[HEADER.size:HEADER.size + metadata_length]).decode('utf-8'))
+
+    arrays = []
+    for offset, typecode, length in metadata['arrays']:
+        itemsize = array(typecode).itemsize
+        arrays.append(buffer[offset:offset + length * itemsize].cast(typecode))
+
+    layers = [LevelLayer(layer['name'], layer['visible'], layer['width'], layer['height'], arrays[layer['data']])
+              for layer in metadata['layers']]
+
+    height_masks = {}
+    tables = arrays[metadata['height_mask_tables']]
+    tile_width, tile_height = metadata['tile_size']
+    for i, gid in enumerate(arrays[metadata['height_mask_gids']]):
+        start = i * (tile_width + tile_height)
+        height_masks[gid] = HeightMask(tables[start:start + tile_width],
+                                       tables[start + tile_width:start + tile_width + tile_height])
+
+    object_layers = [LevelObjectLayer(layer['name'], layer['visible'],
+                                      [LevelObject(*values) for values in layer['objects']])
+                     for layer in metadata['object_layers']]
+
+    level = Level(tmx_path, metadata['width'], metadata['height'], metadata['tile_size'], layers,
+                  [(os.path.normpath(os.path.join(os.path.dirname(tmx_path), path)), colorkey)
+                   for path, colorkey in metadata['image_sources']], arrays[metadata['tile_table']],
+                  height_masks, dict((gid, [tuple(frame) for frame in frames])
+                                     for gid, frames in metadata['animations']), object_layers)
+
+    # Keep the mapping alive for as long as the level is
+    level.mapped_file = mapped
+    return level
+
+
+def load_level(tmx_path):
+    """ Load a level through its cache, compiling the TMX file first if the cache is missing or stale. """
+    cache_path = get_cache_path(tmx_path)
+    if not is_cache_valid(tmx_path, cache_path):
+        compile_level(tmx_path, cache_path)
+    return read_level(tmx_path, cache_path)
+
+
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        print("Compiled %s" % compile_level(path))
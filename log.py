@@ -0,0 +1,141 @@
+# -------------------------------------------------------------------- #
+# log.py
+#   leveled logging by category (player, game, scene...). Messages are
+#   kept in a ring buffer the debug overlay shows, and written to stdout
+#   in one go at the end of each frame instead of one print at a time.
+#   Messages below a category's level are dropped right away, and are
+#   only formatted when they get through.
+#
+#   log = get_logger("player")
+#   log.debug("input: %s", key)
+#
+#   python main.py --log player=debug,game=warning
+# -------------------------------------------------------------------- #
+
+# General imports:
+import atexit
+import sys
+import threading
+import time
+from collections import deque
+
+# Local imports:
+from constants import *
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVEL_NAMES = {DEBUG: "debug", INFO: "info", WARNING: "warning", ERROR: "error"}
+LEVELS = dict((name, level) for level, name in LEVEL_NAMES.items())
+
+# Category -> Logger
+loggers = {}
+
+# Level of categories without a level of their own, and the ones that have one, see configure()
+default_level = LOG_LEVEL
+category_levels = {}
+
+# (time, level, category, message) of the last LOG_HISTORY messages, for the debug overlay
+history = deque(maxlen=LOG_HISTORY)
+
+# Lines waiting to be written by flush(), scenes can be loaded on another thread
+pending = []
+pending_lock = threading.Lock()
+
+start_time = time.perf_counter()
+
+
+def _ignore(message, *args):
+    pass
+
+
+class Logger(object):
+    """ Logs one category's messages. Its debug/info/warning/error methods are swapped for a function
+        doing nothing while their level is switched off, so disabled messages cost a bare call. """
+
+    def __init__(self, category, level=LOG_LEVEL):
+        self.category = category
+        self.set_level(level)
+
+    def set_level(self, level):
+        self.level = LEVELS[level] if isinstance(level, str) else level
+        for method_level, name in LEVEL_NAMES.items():
+            if method_level >= self.level:
+                # Drop the instance attribute, back to the real method
+                self.__dict__.pop(name, None)
+            else:
+                setattr(self, name, _ignore)
+
+    def is_enabled(self, level):
+        """ For messages whose arguments are costly to work out, check before logging them. """
+        return level >= self.level
+
+    def log(self, level, message, *args):
+        if level < self.level:
+            return
+        if args:
+            message = message % args
+        record = (time.perf_counter() - start_time, level, self.category, message)
+        history.append(record)
+        with pending_lock:
+            pending.append(format_record(record))
+            full = len(pending) >= LOG_FLUSH_SIZE
+        if full:
+            flush()
+
+    def debug(self, message, *args):
+        self.log(DEBUG, message, *args)
+
+    def info(self, message, *args):
+        self.log(INFO, message, *args)
+
+    def warning(self, message, *args):
+        self.log(WARNING, message, *args)
+
+    def error(self, message, *args):
+        self.log(ERROR, message, *args)
+
+
+def get_logger(category):
+    logger = loggers.get(category)
+    if logger is None:
+        logger = loggers[category] = Logger(category, category_levels.get(category, default_level))
+    return logger
+
+
+def format_record(record):
+    seconds, level, category, message = record
+    return "[%9.3f] %-7s %s: %s\n" % (seconds, LEVEL_NAMES[level].upper(), category, message)
+
+
+def flush():
+    """ Write out the pending messages. Called by the game loop once per frame, and on exit. """
+    if pending:
+        with pending_lock:
+            lines = ''.join(pending)
+            del pending[:]
+        sys.stdout.write(lines)
+        sys.stdout.flush()
+
+
+atexit.register(flush)
+
+
+def configure(spec):
+    """ Set levels from a comma separated list of category=level, or just a level for every category,
+        like "warning,player=debug". """
+    global default_level
+    for item in spec.split(','):
+        category, _, level = item.strip().rpartition('=')
+        if level not in LEVELS:
+            raise ValueError("Unknown log level %r, use one of %s" % (level, ", ".join(LEVELS)))
+        if category:
+            category_levels[category] = level
+            if category in loggers:
+                loggers[category].set_level(level)
+        else:
+            default_level = level
+            for name, logger in loggers.items():
+                if name not in category_levels:
+                    logger.set_level(level)
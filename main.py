@@ -7,50 +7,152 @@
 #   main function, create instance of Title Screen scene, game loop.
 # -------------------------------------------------------------------- #
 
+# Startup timing, before anything else gets imported, see startup.py
+import startup
+
+# General imports:
+import argparse
+import sys
+
 # Game library imports:
 import pygame
+startup.mark("import pygame")
 
 # Local imports:
+# Only what the title screen needs. The game scene's modules are imported while the title screen is up,
+# see title.py, and the headless and replay modes import theirs when they're asked for.
 from constants import *
+from chunk_renderer import LEVEL_RENDERERS
+from display import SCALING_MODES, Display, parse_size
+from log import configure as configure_log, flush as flush_log, get_logger
+from profiler import profiler
 from title import TitleScene
+startup.mark("import title screen")
 
-def main():
+def main(record=None, window_size=WINDOW_SIZE, scaling=SCALING_MODE, startup_report=False, renderer=LEVEL_RENDERER):
     # Initialize all imported pygame modules
     pygame.init()
+    startup.mark("pygame.init")
 
     # Set up clock
     fpsClock = pygame.time.Clock()
 
-    # Set screen/window resolution
-    screen = pygame.display.set_mode([SCREEN_WIDTH, SCREEN_HEIGHT])
+    # Set window resolution. Scenes draw at the game's native resolution, scaled up to the window
+    display = Display(window_size, scaling)
+    startup.mark("window")
 
     # Set starting scene as the title screen / main menu
-    starting_scene = TitleScene()
+    # The player's input is recorded when asked to, see replay.py
+    recorder = None
+    if record:
+        from replay import InputRecorder
+        recorder = InputRecorder(record)
+    starting_scene = TitleScene(recorder, renderer)
 
     # Set up title scene
     active_scene = starting_scene
+    active_scene.start()
+    startup.mark("title screen")
+    first_frame = True
 
-    active_surface = pygame.Surface([640, 480])
+    # Time not yet simulated by the physics, in milliseconds
+    accumulator = 0.0
 
     # Game loop.
     while True:
-        # Frames per second command
-        dt = fpsClock.tick(FPS) # convert to seconds
+        # Frames per second command, returns milliseconds since the last frame
+        frame_time = fpsClock.tick(FPS)
+
+        # A frame that took too long (window dragged, debugger...) only catches up MAX_PHYSICS_STEPS,
+        # otherwise slow frames would cause even more physics steps, and even slower frames.
+        accumulator += min(frame_time, PHYSICS_STEP * MAX_PHYSICS_STEPS)
+
+        # Time everything below, when the profiler is on. See profiler.py
+        profiler.begin_frame()
 
         # Change scene if previous scene ended
-        active_scene = active_scene.next
+        if active_scene.next is not active_scene:
+            active_scene = active_scene.next
+            active_scene.start()
 
         # Check for user input
-        active_scene.events(pygame.event.get(), pygame.key.get_pressed())
+        with profiler.section("events"):
+            events = pygame.event.get()
+            # Whatever was over the window is gone, everything has to be drawn again
+            if any(event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED) for event in events):
+                active_scene.redraw_all = True
+            active_scene.events(events, pygame.key.get_pressed())
+
+        # Game logic & mechanics, in fixed steps so results don't depend on the frame rate
+        with profiler.section("update"):
+            while accumulator >= PHYSICS_STEP:
+                active_scene.update(PHYSICS_STEP)
+                accumulator -= PHYSICS_STEP
 
-        # Game logic & mechanics
-        active_scene.update(dt)
+        # Draw / render frame, between the last two physics steps
+        with profiler.section("draw"):
+            active_scene.interpolate(accumulator / PHYSICS_STEP)
+            dirty_rects = active_scene.draw(display.surface)
 
-        # Draw / render frame
-        active_scene.draw(screen, active_surface)
+        # Scale the frame to the window and display it, see display.py.
+        # Only the parts that changed when the scene knows which ones did, nothing at all if none did.
+        with profiler.section("flip"):
+            display.present(dirty_rects, active_scene)
 
-        # This command makes everything drawn on screen finally get displayed
-        pygame.display.flip()  # TODO: should I use display.update() instead?
+        profiler.end_frame()
+
+        if first_frame:
+            startup.mark("first frame")
+            first_frame = False
+
+        # With --startup-report, leave once the game scene has loaded in the background too
+        if startup_report and starting_scene.loader.done:
+            log = get_logger("startup")
+            for line in startup.report():
+                log.info(line)
+            flush_log()
+            pygame.quit()
+            return
+
+        # Write out the frame's log messages all at once, see log.py
+        flush_log()
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Quill Engine")
+    parser.add_argument('--headless', type=int, metavar='STEPS',
+                        help="run the game for STEPS physics steps without a window, see headless.py")
+    parser.add_argument('--record', metavar='FILE',
+                        help="record the player's input to FILE when leaving the game, see replay.py")
+    parser.add_argument('--replay', metavar='FILE',
+                        help="replay a recording without a window, checking it ends up where it did")
+    parser.add_argument('--window', type=parse_size, default=WINDOW_SIZE, metavar='WIDTHxHEIGHT',
+                        help="window size, the game is scaled up to it from %dx%d" % (SCREEN_WIDTH, SCREEN_HEIGHT))
+    parser.add_argument('--scaling', choices=SCALING_MODES, default=SCALING_MODE,
+                        help="'integer' scaling keeps pixels sharp, 'smooth' fills more of the window")
+    parser.add_argument('--renderer', choices=LEVEL_RENDERERS, default=LEVEL_RENDERER,
+                        help="how the level is drawn, 'chunks' blits pre-baked chunks of it, see chunk_renderer.py")
+    parser.add_argument('--startup-report', action='store_true',
+                        help="print how long starting up took, once the game has loaded, and quit")
+    parser.add_argument('--log', metavar='LEVELS',
+                        help="log levels, like 'warning' or 'info,player=debug', see log.py")
+    args = parser.parse_args()
+    if args.window[0] < SCREEN_WIDTH or args.window[1] < SCREEN_HEIGHT:
+        parser.error("the window can't be smaller than %dx%d" % (SCREEN_WIDTH, SCREEN_HEIGHT))
+    if args.log:
+        try:
+            configure_log(args.log)
+        except ValueError as error:
+            parser.error(str(error))
+
+    if args.headless is not None:
+        from headless import run_headless
+        run_headless(args.headless)
+    elif args.replay:
+        from replay import run_replay
+        mismatches = run_replay(args.replay, strict=False)
+        for mismatch in mismatches:
+            print("Checkpoint mismatch at %s" % mismatch)
+        if mismatches:
+            sys.exit(1)
+    else:
+        main(args.record, args.window, args.scaling, args.startup_report, args.renderer)
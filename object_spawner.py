@@ -0,0 +1,145 @@
+# -------------------------------------------------------------------- #
+# object_spawner.py
+#   keeps every object placed in the level (see objects.py) in a grid of
+#   cells over the level, and only brings to life the ones in the cells
+#   around the camera. Objects outside of that window cost nothing each
+#   frame, so a level full of objects runs as fast as an empty one.
+#
+#   spawner = ObjectSpawner(level.objects, entities, (object_list, group))
+#   spawner.update(camera_view)  # each physics step, see GameScene.update()
+# -------------------------------------------------------------------- #
+
+# General imports:
+import struct
+
+# Local imports:
+from constants import *
+from log import get_logger
+from objects import OBJECT_CLASSES
+
+log = get_logger("objects")
+
+# Snapshot: active and destroyed object counts, the indexes of the destroyed ones,
+# then the index and entity row of each active one followed by its own snapshot
+OBJECT_SNAPSHOT_HEADER = struct.Struct('<II')
+OBJECT_SNAPSHOT_INDEX = struct.Struct('<I')
+OBJECT_SNAPSHOT_ACTIVE = struct.Struct('<II')
+
+
+class ObjectSpawner(object):
+    """ Spatial index of a level's objects, and the sprites of the ones near the camera.
+        Sprites are added to groups when their object comes into the activation window,
+        and removed from them once it's gone out of it. Each one has a row of the entity store
+        (see entities.py) while it's active. """
+
+    def __init__(self, level_objects, entities, groups=(), cell_size=OBJECT_CELL_SIZE, margin=OBJECT_ACTIVATION_MARGIN):
+        self.entities = entities
+        self.groups = groups
+        self.cell_size = cell_size
+        self.margin = margin
+
+        # Every object, in the order they were added
+        self.objects = []
+
+        # (cell_x, cell_y) -> indexes in self.objects of the objects overlapping that cell
+        self.cells = {}
+
+        # Index in self.objects -> sprite, for the objects in the activation window
+        self.active = {}
+
+        # Indexes of the objects destroyed while active (collected rings, beaten enemies), they stay gone
+        self.destroyed = set()
+
+        # First and last cells of the activation window, see update()
+        self.window = None
+
+        # Object types without a class, only warned about once
+        self.unknown_types = set()
+
+        for level_object in level_objects:
+            self.add(level_object)
+
+    def add(self, level_object):
+        index = len(self.objects)
+        self.objects.append(level_object)
+        rect = level_object.rect
+        for x in range(rect.left // self.cell_size, (rect.right - 1) // self.cell_size + 1):
+            for y in range(rect.top // self.cell_size, (rect.bottom - 1) // self.cell_size + 1):
+                self.cells.setdefault((x, y), []).append(index)
+
+        # Picked up by the next update()
+        self.window = None
+
+    def window_cells(self, view_rect):
+        """ First and last cells of the activation window around a pixel rect. """
+        size = self.cell_size
+        return (view_rect.left // size - self.margin, view_rect.top // size - self.margin,
+                (view_rect.right - 1) // size + self.margin, (view_rect.bottom - 1) // size + self.margin)
+
+    def update(self, view_rect):
+        # Sprites killed since the last update were destroyed, see LevelSprite.destroy()
+        for index in [index for index, sprite in self.active.items() if not sprite.alive()]:
+            del self.active[index]
+            self.destroyed.add(index)
+
+        # Nothing comes or goes until the camera moves into other cells
+        window = self.window_cells(view_rect)
+        if window == self.window:
+            return
+        self.window = window
+
+        first_x, first_y, last_x, last_y = window
+        wanted = set()
+        for y in range(first_y, last_y + 1):
+            for x in range(first_x, last_x + 1):
+                wanted.update(self.cells.get((x, y), ()))
+
+        for index in [index for index in self.active if index not in wanted]:
+            self.active.pop(index).kill()
+        for index in wanted:
+            if index not in self.active and index not in self.destroyed:
+                self.spawn(index)
+
+    def spawn(self, index, row=None):
+        level_object = self.objects[index]
+        object_class = OBJECT_CLASSES.get(level_object.type)
+        if object_class is None:
+            if level_object.type not in self.unknown_types:
+                self.unknown_types.add(level_object.type)
+                log.warning("No class for objects of type %r, they're left out", level_object.type)
+            return None
+
+        sprite = self.active[index] = object_class(level_object, self.entities, row)
+        sprite.add(*self.groups)
+        return sprite
+
+    def clear(self):
+        """ Take every sprite away, the next update() brings back the ones in the window. """
+        for sprite in self.active.values():
+            sprite.kill()
+        self.active.clear()
+        self.window = None
+
+    # Snapshots, see GameScene.take_snapshot()
+
+    def snapshot(self):
+        destroyed = sorted(self.destroyed)
+        data = [OBJECT_SNAPSHOT_HEADER.pack(len(self.active), len(destroyed)),
+                struct.pack('<%dI' % len(destroyed), *destroyed)]
+        for index, sprite in self.active.items():
+            data += [OBJECT_SNAPSHOT_ACTIVE.pack(index, sprite.row), sprite.snapshot()]
+        return b''.join(data)
+
+    def restore(self, data, offset=0):
+        """ Go back to a snapshot() read from data at offset. Returns the offset right after it.
+            The sprites take over their rows as they are in the entity store, so it has to be restored
+            first, and this cleared before that, see GameScene.restore_snapshot(). """
+        self.clear()
+        count, destroyed_count = OBJECT_SNAPSHOT_HEADER.unpack_from(data, offset)
+        offset += OBJECT_SNAPSHOT_HEADER.size
+        self.destroyed = set(struct.unpack_from('<%dI' % destroyed_count, data, offset))
+        offset += destroyed_count * OBJECT_SNAPSHOT_INDEX.size
+        for _ in range(count):
+            index, row = OBJECT_SNAPSHOT_ACTIVE.unpack_from(data, offset)
+            offset = self.spawn(index, row).restore(data, offset + OBJECT_SNAPSHOT_ACTIVE.size)
+        return offset
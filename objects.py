@@ -0,0 +1,183 @@
+# -------------------------------------------------------------------- #
+# objects.py
+#   objects placed in the level's Tiled object layers: rings, monitors
+#   and enemies. They only exist while they're near the camera, the
+#   ObjectSpawner (see object_spawner.py) makes and throws them away.
+#   Until they get sprites of their own they're drawn as plain shapes.
+#
+#   In Tiled, give objects one of the types in OBJECT_CLASSES.
+#   What happens when the player touches them is up to each class,
+#   see touch_player() and actor_collision.py
+# -------------------------------------------------------------------- #
+
+# Game library imports:
+import pygame
+
+# Local imports:
+from constants import *
+from entities import entity_field
+from log import get_logger
+
+log = get_logger("objects")
+
+# Pixels an enemy walks each physics step
+ENEMY_SPEED = 1
+
+# How far enemies walk from where they were placed, unless their "range" property says otherwise
+ENEMY_RANGE = 32
+
+
+class LevelSprite(pygame.sprite.Sprite):
+    """ Base class of the placed objects, made from a LevelObject (see level.py) when it comes near the camera.
+        While it's active, its position lives in a row of the game's entity store, see entities.py. """
+
+    # (class, size) -> image, every object of a class and size shares the same one
+    images = {}
+
+    # Collision group, and the groups it wants to hear about, see actor_collision.py
+    collision_group = 0
+    collides_with = 0
+
+    x = entity_field('x')
+    y = entity_field('y')
+
+    # row is only given when restoring a snapshot, the store already holds it as it was then
+    def __init__(self, level_object, entities, row=None):
+        super().__init__()
+        self.level_object = level_object
+        self.rect = level_object.rect
+        self.image = self.get_image(self.rect.size)
+
+        self.entities = entities
+        if row is None:
+            self.row = entities.add(self.rect.x, self.rect.y)
+        else:
+            self.row = row
+            self.rect.topleft = int(self.x), int(self.y)
+
+    @classmethod
+    def get_image(cls, size):
+        image = LevelSprite.images.get((cls, size))
+        if image is None:
+            image = LevelSprite.images[(cls, size)] = cls.make_image(size)
+        return image
+
+    @staticmethod
+    def make_image(size):
+        image = pygame.Surface(size, pygame.SRCALPHA)
+        image.fill(PINK)
+        return image
+
+    # Called once per physics step while the object is active
+    def update(self, dt):
+        pass
+
+    # Called with every actor it touched this physics step, in the groups in collides_with
+    def on_touch(self, others):
+        pass
+
+    # Called when the player touches it, see Player.on_touch()
+    def touch_player(self, player):
+        pass
+
+    # Gone for good, it won't come back when the camera comes by again, see ObjectSpawner.update()
+    def destroy(self):
+        self.kill()
+
+    # Destroyed or out of the activation window, its row goes back to the entity store
+    def kill(self):
+        if self.row is not None:
+            self.entities.remove(self.row)
+            self.row = None
+        super().kill()
+
+    # Snapshots, see ObjectSpawner.snapshot(). The row is saved with the entity store,
+    # objects with nothing else that changes while they're active have nothing to save.
+    def snapshot(self):
+        return b''
+
+    def restore(self, data, offset):
+        return offset
+
+
+class Ring(LevelSprite):
+    collision_group = COLLIDE_ITEM
+
+    def __init__(self, level_object, entities, row=None):
+        LevelSprite.__init__(self, level_object, entities, row)
+        # Collides as a circle, see actor_collision.py
+        self.radius = self.rect.width // 2
+
+    def touch_player(self, player):
+        player.rings += 1
+        log.debug("Ring collected, %d rings", player.rings)
+        self.destroy()
+
+    @staticmethod
+    def make_image(size):
+        image = pygame.Surface(size, pygame.SRCALPHA)
+        pygame.draw.ellipse(image, YELLOW, image.get_rect(), 3)
+        return image
+
+
+class Monitor(LevelSprite):
+    collision_group = COLLIDE_ITEM
+
+    # Broken by jumping or rolling into it
+    def touch_player(self, player):
+        if player.attacking:
+            player.bounce()
+            self.destroy()
+
+    @staticmethod
+    def make_image(size):
+        image = pygame.Surface(size, pygame.SRCALPHA)
+        image.fill(GRAY)
+        pygame.draw.rect(image, BLUE, image.get_rect().inflate(-8, -8))
+        pygame.draw.rect(image, WHITE, image.get_rect(), 1)
+        return image
+
+
+class Enemy(LevelSprite):
+    """ Walks back and forth from where it was placed. Beaten by jumping or rolling into it,
+        or by a projectile, otherwise it hurts the player. """
+
+    collision_group = COLLIDE_ENEMY
+    collides_with = COLLIDE_PROJECTILE
+
+    def __init__(self, level_object, entities, row=None):
+        LevelSprite.__init__(self, level_object, entities, row)
+        if row is None:
+            # The entity store walks it and turns it around, see EntityStore.apply_patrols()
+            start_x = self.rect.x
+            entities.x_speed[self.row] = ENEMY_SPEED
+            entities.patrol_left[self.row] = start_x
+            entities.patrol_right[self.row] = start_x + level_object.properties.get('range', ENEMY_RANGE)
+
+    @staticmethod
+    def make_image(size):
+        image = pygame.Surface(size, pygame.SRCALPHA)
+        pygame.draw.ellipse(image, RED, image.get_rect())
+        return image
+
+    def update(self, dt):
+        # Moved by the entity store this physics step
+        self.rect.x = int(self.x)
+
+    def on_touch(self, others):
+        self.destroy()
+
+    def touch_player(self, player):
+        if player.attacking:
+            player.bounce()
+            self.destroy()
+        else:
+            player.hurt(self)
+
+
+# Tiled object type -> class
+OBJECT_CLASSES = {
+    'ring': Ring,
+    'monitor': Monitor,
+    'enemy': Enemy,
+}
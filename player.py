@@ -3,36 +3,94 @@
 #   Player class
 # -------------------------------------------------------------------- #
 
+import struct
+
 import pygame
-from math import sin, cos
+from angles import COSINE_TABLE, MODE_FLOOR, MODE_NAMES, MODE_OF_ANGLE, SINE_TABLE, angle_to_degrees
 from constants import *
+from entities import entity_field, entity_state
+from log import get_logger
 from sensor import Sensor
-from spritesheet import SpriteSheet
+from sprite_atlas import load_atlas
+
+log = get_logger("player")
+
+# Snapshot of what a player keeps outside of the entity store, see Player.snapshot()
+PLAYER_SNAPSHOT_FLAGS = ('flag_allow_jump', 'flag_allow_vertical_movement', 'flag_jump_next_frame',
+                         'flag_fell_off_wall_or_ceiling', 'flag_is_jumping', 'key_up', 'key_down',
+                         'key_left', 'key_right', 'key_jump', 'facing_left')
+PLAYER_SNAPSHOT = struct.Struct('<%d?2i' % len(PLAYER_SNAPSHOT_FLAGS))
+
+# Per sensor: activated, distance (0 when not activated), angle
+SENSOR_SNAPSHOT = struct.Struct('<?iB')
+
+# Physics constants, in pixels per physics step (speeds) and per step squared (accelerations).
+# Each player can be given its own, see Player.__init__() and batch.py
+PLAYER_PHYSICS = {
+    'air': 0.09375,
+    'jump_speed': 6.5,
+    'top_speed': 6,
+    'gravity': 0.21875,
+    # http://info.sonicretro.org/SPG:Running#Variables
+    'acceleration': 0.046875,
+    'deaccelerate': 0.5,
+    'friction': 0.046875,
+    # TODO: roll isn't used yet
+    'roll': 1.03125,
+    'slope': 0.125,
+}
+
+# Hitbox size, centered on the bottom of the sprite where Sonic's feet are, see actor_collision.py
+PLAYER_HITBOX = (20, 38)
+
+# y speed the player bounces off enemies and monitors with, and hops with when hurt
+BOUNCE_SPEED = 4
+
+# Ground speed below which the player falls off walls and ceilings
+# http://info.sonicretro.org/SPG:Slope_Physics#Falling_and_Slipping_Down_Slopes
+FALL_OFF_SPEED = 2.5
 
 class Player(pygame.sprite.Sprite):
-    def __init__(self, x, y, game):
+    # The player's physics state lives in its row of the game's entity store, see entities.py.
+    # Gravity, movement and states are worked out there for every actor at once.
+    x = entity_field('x')
+    y = entity_field('y')
+    previous_x = entity_field('previous_x')
+    previous_y = entity_field('previous_y')
+    x_speed = entity_field('x_speed')
+    y_speed = entity_field('y_speed')
+    ground_speed = entity_field('ground_speed')
+    gravity = entity_field('gravity')
+    slope = entity_field('slope')
+    # Angle of the ground under the player, in steps of angles.py. 0 while airborne.
+    angle = entity_field('angle', int)
+    flag_ground = entity_field('ground', bool)
+    frame_index = entity_field('frame_index', int)
+    _state = entity_state()
+
+    # Touches rings, monitors and enemies, see actor_collision.py
+    collision_group = COLLIDE_PLAYER
+    collides_with = COLLIDE_ITEM | COLLIDE_ENEMY
+
+    # physics overrides some of PLAYER_PHYSICS, like {'gravity': 0.25}
+    def __init__(self, x, y, game, physics=None):
         # Call the parent's constructor
         super().__init__()
 
         self.game = game
 
+        # Sub-pixel position used by the physics, the rect follows it.
+        # The position before the last update lets draws interpolate between physics steps.
+        self.entities = game.entities
+        self.row = self.entities.add(x, y)
+
         # Physics constants:
-        self.air = 0.09375
-        self.jump_speed = 6.5
-        # TODO: set top_speed in accordance with sonic physics guide
-        self.top_speed = 6
-        self.gravity = 0.21875
-        self.acceleration = 0.5
-        self.deaccelerate = 0.5
-        self.friction = 0.5
-        # TODO : check if we need the next two:
-        self.roll = 1.03125
-        self.slope = 0.125
-
-        # Movement can be rotated using angle and gangle:
-        self.angle = 0.0
-        self.gangle = 0.0
-        self.rangle = 0.0
+        physics = dict(PLAYER_PHYSICS, **(physics or {}))
+        unknown = set(physics) - set(PLAYER_PHYSICS)
+        if unknown:
+            raise ValueError("Unknown player physics constants: %s" % ", ".join(sorted(unknown)))
+        for name, value in physics.items():
+            setattr(self, name, value)
 
         # http://info.sonicretro.org/SPG:Solid_Tiles#The_Three_Speed_Variables
         # 3 Speed Variables:
@@ -59,43 +117,9 @@ class Player(pygame.sprite.Sprite):
         self.key_right = False
         self.key_jump = False
 
-        # Get player sprite sheet
-        player_sprites = SpriteSheet(CHARACTER_SHEET)
-
-        # Animation lists
-        self.walk_frames = []
-        self.stand_frames = []
-        self.dash_frames = []
-        self.run_frames = []
-        self.jump_frames = []
-
-        # Append walking frames
-        for x in range(WALK_FRAMES_COUNT):
-            image = player_sprites.get_image(
-                x * FRAME_WIDTH + x * FRAME_SPACING,
-                WALK_START_POS[1], FRAME_WIDTH, FRAME_HEIGHT)
-            self.walk_frames.append(image)
-
-        # Append standing / stopped frames
-        for x in range(STAND_FRAMES_COUNT):
-            image = player_sprites.get_image(
-                x * FRAME_WIDTH + x * FRAME_SPACING,
-                STAND_START_POS[1], FRAME_WIDTH, FRAME_HEIGHT)
-            self.stand_frames.append(image)
-
-        # TODO: remove these three lines once we get dash & jump frames implimented
-        self.dash_frames = self.walk_frames
-        self.jump_frames = self.walk_frames
-        self.run_frames = self.walk_frames
-
-        # A dictionary of the various animations that correspond to Sonic's various states.
-        self.animations = {
-            WALKING_STATE: self.walk_frames,
-            JUMPING_STATE: self.jump_frames,
-            STOPPED_STATE: self.stand_frames,
-            RUNNING_STATE: self.run_frames,
-            DASHING_STATE: self.dash_frames
-        }
+        # Animations, shared by every player using the same animation file, see sprite_atlas.py
+        # Each of Sonic's states has an animation of the same name.
+        self.atlas = load_atlas(CHARACTER_ANIMATIONS)
 
         # A variable containing Sonic's current, active state:
         self._state = STOPPED_STATE
@@ -103,14 +127,21 @@ class Player(pygame.sprite.Sprite):
         # The current frame in Sonic's animation sequence.
         self.frame_index = 0
 
+        # Which way Sonic is facing, the frames on the sheet face right
+        self.facing_left = False
+
+        # Rings collected, and physics steps left before getting hurt again
+        self.rings = 0
+        self.invulnerable_steps = 0
+
         # Set the image the player starts with
-        self.image = self.animations.get(self._state)[self.frame_index]
+        self.image = self.atlas.get_frame(self._state, self.frame_index)
 
         # Set a reference to the image rect.
         self.rect = self.image.get_rect()
 
         # variables for location of player on screen
-        self.rect.x, self.rect.y = x, y
+        self.sync_rect()
 
         # Sensors (for collision physics)
         # see http://info.sonicretro.org/SPG:Solid_Tiles#Sensor_Process
@@ -121,9 +152,10 @@ class Player(pygame.sprite.Sprite):
                                   SENSOR_LEFT_WALL, PINK)
         self.s_right_wall = Sensor(self.rect, [34, 29],
                                    SENSOR_RIGHT_WALL, RED)
-        self.s_left_floor = Sensor(self.rect, [18, 30],
+        # Floor sensors sit on the bottom row of the sprite, at Sonic's feet
+        self.s_left_floor = Sensor(self.rect, [18, FRAME_HEIGHT - 1],
                                    SENSOR_LEFT_FLOOR, GREEN)
-        self.s_right_floor = Sensor(self.rect, [32, 30],
+        self.s_right_floor = Sensor(self.rect, [32, FRAME_HEIGHT - 1],
                                     SENSOR_RIGHT_FLOOR, PURPLE)
         self.sensors = [
             self.s_left_wall,
@@ -132,6 +164,11 @@ class Player(pygame.sprite.Sprite):
             self.s_right_floor
         ]
 
+        # How far below the floor sensors the player's feet are
+        self.floor_sensor_reach = FRAME_HEIGHT - self.s_left_floor.relative_position[1]
+        # How far the feet can be from the floor while still sticking to it
+        self.floor_snap_distance = 14
+
     # Change sonic to a different state and reset the animation for the new state
     def change_state(self, state):
         if self._state != state:
@@ -141,74 +178,194 @@ class Player(pygame.sprite.Sprite):
     # Advance to the next frame in sonic's animation sequence
     def advance_animation(self):
         # Jump back to frame 0 if last frame in list was reached
-        if self.frame_index < len(self.animations.get(self._state)) - 1:
+        if self.frame_index < self.atlas.frame_count(self._state) - 1:
             self.frame_index += 1
         else:
         # Otherwise, advance to the next frame in the animation sequence!
             self.frame_index = 0
 
+    # Show the current animation frame, facing the way Sonic moves and rotated to the ground angle.
+    # Called every physics step, once the entity store worked out the new state.
+    def update_image(self):
+        self.sync_rect()
+        # Along the ground, forwards is the way the ground speed goes, even upside down on a ceiling
+        speed = self.ground_speed if self.flag_ground else self.x_speed
+        if speed < 0:
+            self.facing_left = True
+        elif speed > 0:
+            self.facing_left = False
+        self.image = self.atlas.get_frame(self._state, self.frame_index, self.facing_left,
+                                          angle_to_degrees(self.angle))
+
     def handle_physics(self, dt):
+        if self.flag_ground:
+            self.handle_ground_input()
         self.advance_animation()
 
-    def perform_gravity_movement(self, dt):
-        self.y_speed += self.gravity / dt
+    # http://info.sonicretro.org/SPG:Running
+    # Speeding up, turning around and slowing down along the ground. The entity store turns the
+    # ground speed into x and y speeds at the ground's angle, and slows it down on slopes.
+    def handle_ground_input(self):
+        speed = self.ground_speed
+        if self.key_left and not self.key_right:
+            if speed > 0:
+                # Turning around doesn't stop dead, it flips over to a small speed the other way
+                speed -= self.deaccelerate
+                if speed <= 0:
+                    speed = -0.5
+            elif speed > -self.top_speed:
+                speed = max(speed - self.acceleration, -self.top_speed)
+        elif self.key_right and not self.key_left:
+            if speed < 0:
+                speed += self.deaccelerate
+                if speed >= 0:
+                    speed = 0.5
+            elif speed < self.top_speed:
+                speed = min(speed + self.acceleration, self.top_speed)
+        elif speed > 0:
+            speed = max(speed - self.friction, 0)
+        else:
+            speed = min(speed + self.friction, 0)
+        self.ground_speed = speed
 
-    # States are used to change the animations
-    def calculate_state(self):
-        if self.flag_ground:
-            # stopped
-            if self.ground_speed == 0:
-                self.change_state(STOPPED_STATE)
-            # walk right
-            elif self.ground_speed > 0 and self.ground_speed < 6:
-                self.change_state(WALKING_STATE)
-            # walk left
-            elif self.ground_speed < 0 and self.ground_speed > -6:
-                self.change_state(WALKING_STATE)
-            # run right
-            elif self.ground_speed > 6 and self.ground_speed < 10:
-                self.change_state(RUNNING_STATE)
-            # run left
-            elif self.ground_speed < -6 and self.ground_speed > -10:
-                self.change_state(RUNNING_STATE)
-            # dash right
-            elif self.ground_speed > 10:
-                self.change_state(DASHING_STATE)
-            #dash left
-            elif self.ground_speed < -10:
-                self.change_state(DASHING_STATE)
-            else:
-                print("if you got here, this logic chain is broken")
-
-        print("finish")
+    # http://info.sonicretro.org/SPG:Slope_Physics#Sensor_Modes
+    # Which side of the player the ground is on, which decides which way the sensors look
+    @property
+    def mode(self):
+        return MODE_OF_ANGLE[self.angle] if self.flag_ground else MODE_FLOOR
 
     # Handle key press events for player
     def key_press(self, event, pressed_keys):
         if event.key == pygame.K_a:
-            print("Player input: A")
+            log.debug("input: A pressed")
             self.key_left = True
         elif event.key == pygame.K_d:
-            print("Player input: D")
+            log.debug("input: D pressed")
             self.key_right = True
 
     # Handle key release events for player    
     def key_release(self, event, pressed_keys):
         if event.key == pygame.K_a:
-            print("Player input: A")
+            log.debug("input: A released")
             self.key_left = False
         elif event.key == pygame.K_d:
-            print("Player input: D")
+            log.debug("input: D released")
             self.key_right = False
 
+    # Move the sensors along with the player. They're all checked at once afterwards, see GameScene.collide_actors()
+    def move_sensors(self):
+        self.sync_rect()
+        mode = self.mode
+        for sensor in self.sensors:
+            sensor.update(self.rect, mode)
+
+    # http://info.sonicretro.org/SPG:Solid_Tiles#Floor_Sensors_.28A_and_B.29
+    # Both floor sensors look for the floor, and the one that found the nearest surface wins.
+    # In the other sensor modes they look for the wall or ceiling the player runs along instead.
+    # Returns the winning sensor if the player is standing on the ground, None otherwise.
     def perform_ground_test(self):
-        pass
+        found = [sensor for sensor in (self.s_left_floor, self.s_right_floor) if sensor.distance is not None]
+        if not found:
+            return None
+        nearest = min(found, key=lambda sensor: sensor.distance)
 
-    def perform_speed_movement(self, dt):
-        print(dt)
-        self.rect.y += self.y_speed * dt
+        # Distance between the player's feet and the ground
+        distance = nearest.distance - self.floor_sensor_reach
 
-    # This function is called every frame
+        # Airborne players only land when moving downwards and touching the floor,
+        # grounded players stick to the ground as long as it's close enough.
+        if self.flag_ground:
+            if abs(distance) > self.floor_snap_distance:
+                return None
+        elif self.y_speed < 0 or distance > 0:
+            return None
+
+        # Move the feet onto the ground, the way the sensor looked
+        if nearest.axis:
+            self.y += nearest.sign * distance
+        else:
+            self.x += nearest.sign * distance
+        self.sync_rect()
+        return nearest
+
+    # Touching other actors, see actor_collision.py
+
+    @property
+    def hitbox(self):
+        hitbox = pygame.Rect((0, 0), PLAYER_HITBOX)
+        hitbox.midbottom = self.rect.midbottom
+        return hitbox
+
+    # Rolling and jumping players beat enemies and break monitors
+    @property
+    def attacking(self):
+        return self._state in (JUMPING_STATE, ROLLING_STATE)
+
+    # Called with every ring, monitor and enemy touched this physics step, each decides what happens
+    def on_touch(self, others):
+        for other in others:
+            other.touch_player(self)
+
+    def bounce(self):
+        if self.y_speed > 0:
+            self.y_speed = -self.y_speed
+
+    def hurt(self, by):
+        if self.invulnerable_steps:
+            return
+        log.info("Hurt by %s, lost %d rings", type(by).__name__, self.rings)
+        self.rings = 0
+        self.invulnerable_steps = PLAYER_INVULNERABLE_STEPS
+        self.y_speed = -BOUNCE_SPEED
+        self.flag_ground = False
+        self.angle = 0
+
+    # Snapshots, see GameScene.take_snapshot(). The physics state is in the entity store's snapshot,
+    # these are the flags, keys and sensor results kept on the player itself.
+    def snapshot(self):
+        data = [PLAYER_SNAPSHOT.pack(*[getattr(self, name) for name in PLAYER_SNAPSHOT_FLAGS],
+                                     self.rings, self.invulnerable_steps)]
+        data += [SENSOR_SNAPSHOT.pack(sensor.activated, sensor.distance or 0, sensor.angle)
+                 for sensor in self.sensors]
+        return b''.join(data)
+
+    def restore(self, data, offset=0):
+        # Returns the offset right after this player's snapshot
+        values = PLAYER_SNAPSHOT.unpack_from(data, offset)
+        offset += PLAYER_SNAPSHOT.size
+        for name, value in zip(PLAYER_SNAPSHOT_FLAGS, values):
+            setattr(self, name, value)
+        self.rings, self.invulnerable_steps = values[len(PLAYER_SNAPSHOT_FLAGS):]
+
+        for sensor in self.sensors:
+            sensor.activated, distance, sensor.angle = SENSOR_SNAPSHOT.unpack_from(data, offset)
+            sensor.distance = distance if sensor.activated else None
+            offset += SENSOR_SNAPSHOT.size
+
+        # The rect, image and sensor positions follow from the rest
+        self.update_image()
+        mode = self.mode
+        for sensor in self.sensors:
+            sensor.update(self.rect, mode)
+        return offset
+
+    # Move the rect to the physics position
+    def sync_rect(self):
+        self.rect.x, self.rect.y = int(self.x), int(self.y)
+
+    # Move the rect part of the way between the previous and current physics position,
+    # alpha being how far into the next physics step the frame is drawn.
+    def interpolate(self, alpha):
+        self.rect.x = int(self.previous_x + (self.x - self.previous_x) * alpha)
+        self.rect.y = int(self.previous_y + (self.y - self.previous_y) * alpha)
+
+    # This function is called every physics step, before the entity store moves everything.
+    # Speeds are in pixels per physics step, which is always 1/60 of a second like in the SPG,
+    # see the game loop in main.py. So dt never needs to scale the physics.
     def update(self, dt):
+        if self.invulnerable_steps:
+            self.invulnerable_steps -= 1
+
         # Prevents jumping when not on ground
         if self.flag_ground:
             if not self.key_jump:
@@ -217,13 +374,32 @@ class Player(pygame.sprite.Sprite):
         # Physics function
         self.handle_physics(dt)
 
-        # Move player
-        self.perform_speed_movement(dt)
-
-        # Gravity - if player not on the ground!
-        if not self.flag_ground: # or not self.perform_ground_test():
-            self.perform_gravity_movement(dt)
-
-        # Set the state each update so the right animations display
-        self.calculate_state()
+    # Called once the sensors checked the level, see GameScene.collide_actors()
+    def collide(self):
+        # Gravity is only applied by the entity store if player not on the ground!
+        landing = not self.flag_ground
+        ground = self.perform_ground_test()
+        if ground is None:
+            self.flag_ground = False
+            self.angle = 0
+            return
+
+        angle = ground.angle
+        if landing:
+            # http://info.sonicretro.org/SPG:Slope_Physics#Landing_On_The_Ground
+            # The ground speed is what's left of the speed along the ground the player landed on
+            self.ground_speed = self.x_speed * COSINE_TABLE[angle] - self.y_speed * SINE_TABLE[angle]
+            self.x_speed = self.ground_speed * COSINE_TABLE[angle]
+            self.y_speed = -self.ground_speed * SINE_TABLE[angle]
+
+        # Too slow to keep running along walls and ceilings
+        if MODE_OF_ANGLE[angle] != MODE_FLOOR and abs(self.ground_speed) < FALL_OFF_SPEED:
+            log.debug("Fell off the %s", MODE_NAMES[MODE_OF_ANGLE[angle]])
+            self.flag_fell_off_wall_or_ceiling = True
+            self.flag_ground = False
+            self.angle = 0
+            return
 
+        self.flag_fell_off_wall_or_ceiling = False
+        self.flag_ground = True
+        self.angle = angle
@@ -0,0 +1,111 @@
+# -------------------------------------------------------------------- #
+# profiler.py
+#   per-frame profiler: named timing sections, kept for the last few
+#   hundred frames, shown by the debug overlay and dumped to a file on
+#   request. Turned on together with debug mode (F10), F11 dumps it.
+#
+#   with profiler.section("update"):
+#       ...
+# -------------------------------------------------------------------- #
+
+# General imports:
+import json
+import time
+from collections import deque
+
+# How many frames the profiler remembers
+PROFILER_HISTORY = 240
+
+perf_counter = time.perf_counter
+
+
+class _Section(object):
+    """ Times the code inside a with block, and adds it to the profiler's current frame. """
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = perf_counter()
+
+    def __exit__(self, *exc_info):
+        current = self.profiler.current
+        current[self.name] = current.get(self.name, 0.0) + (perf_counter() - self.start) * 1000
+
+
+class _NullSection(object):
+    """ Stand-in for _Section while the profiler is off, so sections cost next to nothing. """
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_null_section = _NullSection()
+
+
+class FrameProfiler(object):
+    def __init__(self, history=PROFILER_HISTORY):
+        self.enabled = False
+
+        # Each entry: (frame time in ms, {section name: ms})
+        self.frames = deque(maxlen=history)
+
+        # Sections timed so far in the frame being profiled
+        self.current = {}
+        self.frame_start = None
+
+        # One reusable timer per section name
+        self.sections = {}
+
+    def section(self, name):
+        """ Return a context manager timing a named section of the current frame.
+            The same section can run several times a frame (e.g. one per physics step), the times add up. """
+        if not self.enabled:
+            return _null_section
+        section = self.sections.get(name)
+        if section is None:
+            section = self.sections[name] = _Section(self, name)
+        return section
+
+    def begin_frame(self):
+        self.current = {}
+        self.frame_start = perf_counter() if self.enabled else None
+
+    def end_frame(self):
+        if self.frame_start is not None:
+            self.frames.append(((perf_counter() - self.frame_start) * 1000, self.current))
+            self.frame_start = None
+
+    def clear(self):
+        self.frames.clear()
+
+    def frame_times(self):
+        return [frame_time for frame_time, _ in self.frames]
+
+    def averages(self):
+        """ Return {section name: average ms per frame} over the remembered frames, slowest first. """
+        totals = {}
+        for _, sections in self.frames:
+            for name, duration in sections.items():
+                totals[name] = totals.get(name, 0.0) + duration
+        count = len(self.frames) or 1
+        return sorted(((name, total / count) for name, total in totals.items()),
+                      key=lambda item: item[1], reverse=True)
+
+    def dump(self, path):
+        """ Write the remembered frames out as JSON. """
+        with open(path, 'w') as f:
+            json.dump([{'frame_ms': frame_time, 'sections': sections}
+                       for frame_time, sections in self.frames], f, indent=1)
+        return path
+
+
+# The profiler everything reports to
+profiler = FrameProfiler()
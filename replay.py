@@ -0,0 +1,185 @@
+# -------------------------------------------------------------------- #
+# replay.py
+#   records the player's input in the game scene to a small binary file,
+#   with the player's state every few physics steps as checkpoints, and
+#   replays it headless as fast as possible, checking every checkpoint.
+#   Physics run in fixed steps (see main.py), so a replay ends up exactly
+#   where the recorded session did.
+#
+#   python main.py --record session.qrec
+#   python main.py --replay session.qrec
+#
+#   File layout, little-endian:
+#     header        magic, version, physics step (ms), steps, event count, checkpoint count
+#     events        step, key, pressed            (one per key press/release)
+#     checkpoints   step, x, y, x speed, y speed, ground speed, on the ground, state
+# -------------------------------------------------------------------- #
+
+# General imports:
+import struct
+import time
+
+# Game library imports:
+import pygame
+
+# Local imports:
+from constants import *
+from entities import STATE_CODES, STATES
+from headless import init_headless
+from log import flush as flush_log, get_logger
+
+log = get_logger("replay")
+
+REPLAY_MAGIC = b'QREC'
+REPLAY_VERSION = 1
+REPLAY_HEADER = struct.Struct('<4sHdIII')
+REPLAY_EVENT = struct.Struct('<IHB')
+REPLAY_CHECKPOINT = struct.Struct('<Idddddbb')
+
+# Keys the game scene plays with, the only ones recorded. Debug and quit keys are left out.
+RECORDED_KEYS = (pygame.K_a, pygame.K_d, pygame.K_n)
+
+# Physics steps between checkpoints
+CHECKPOINT_INTERVAL = 60
+
+
+class ReplayMismatch(Exception):
+    pass
+
+
+class Recording(object):
+    """ Input events and checkpoints of a session, in the order of the physics steps they happened at. """
+
+    def __init__(self, physics_step=PHYSICS_STEP, steps=0):
+        self.physics_step = physics_step
+
+        # Number of physics steps the recording covers
+        self.steps = steps
+
+        # (step, key, pressed), the key event reaching the game scene before that physics step
+        self.events = []
+
+        # (step, x, y, x_speed, y_speed, ground_speed, flag_ground, state code), after that physics step
+        self.checkpoints = []
+
+    def save(self, path):
+        data = [REPLAY_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, self.physics_step, self.steps,
+                                   len(self.events), len(self.checkpoints))]
+        data += [REPLAY_EVENT.pack(*event) for event in self.events]
+        data += [REPLAY_CHECKPOINT.pack(*checkpoint) for checkpoint in self.checkpoints]
+        with open(path, 'wb') as f:
+            f.write(b''.join(data))
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version, physics_step, steps, event_count, checkpoint_count = REPLAY_HEADER.unpack_from(data)
+        if magic != REPLAY_MAGIC or version != REPLAY_VERSION:
+            raise ValueError("%s is not a version %d replay" % (path, REPLAY_VERSION))
+
+        recording = cls(physics_step, steps)
+        offset = REPLAY_HEADER.size
+        recording.events = list(REPLAY_EVENT.iter_unpack(data[offset:offset + event_count * REPLAY_EVENT.size]))
+        offset += event_count * REPLAY_EVENT.size
+        recording.checkpoints = list(REPLAY_CHECKPOINT.iter_unpack(
+            data[offset:offset + checkpoint_count * REPLAY_CHECKPOINT.size]))
+        return recording
+
+
+def player_checkpoint(step, player):
+    return (step, player.x, player.y, player.x_speed, player.y_speed, player.ground_speed,
+            player.flag_ground, STATE_CODES[player._state])
+
+
+class InputRecorder(object):
+    """ Given to a GameScene, which reports its input and physics steps to it, and saves it on the way out. """
+
+    def __init__(self, path, checkpoint_interval=CHECKPOINT_INTERVAL):
+        self.path = path
+        self.checkpoint_interval = checkpoint_interval
+        self.recording = Recording()
+
+    def record_events(self, step, events):
+        for event in events:
+            if event.type in (pygame.KEYDOWN, pygame.KEYUP) and event.key in RECORDED_KEYS:
+                self.recording.events.append((step, event.key, event.type == pygame.KEYDOWN))
+
+    def record_step(self, step, player):
+        # step is the number of physics steps run so far
+        self.recording.steps = step
+        if step % self.checkpoint_interval == 0:
+            self.recording.checkpoints.append(player_checkpoint(step, player))
+
+    def save(self):
+        log.info("Input recorded to %s", self.recording.save(self.path))
+
+
+def replay_events(recording):
+    """ Yield the pygame events to hand to the game scene before each physics step, one list per step. """
+    events = recording.events
+    index = 0
+    for step in range(recording.steps):
+        step_events = []
+        while index < len(events) and events[index][0] == step:
+            _, key, pressed = events[index]
+            step_events.append(pygame.event.Event(pygame.KEYDOWN if pressed else pygame.KEYUP, key=key))
+            index += 1
+        yield step_events
+
+
+def play_recording(scene, recording):
+    """ Step a scene through a recording's input, without drawing. Yields the number of physics steps
+        run after each one, so the caller can look at the scene in between. """
+    if recording.physics_step != PHYSICS_STEP:
+        raise ValueError("The recording was made with %.3fms physics steps, the game runs %.3fms ones"
+                         % (recording.physics_step, PHYSICS_STEP))
+    pressed_keys = pygame.key.get_pressed()
+    for step, events in enumerate(replay_events(recording), 1):
+        scene.events(events, pressed_keys)
+        scene.update(PHYSICS_STEP)
+        yield step
+
+
+def run_replay(path, scene_class=None, strict=True):
+    """ Replay a recording headless, as fast as possible, comparing the player with every checkpoint.
+        Raises ReplayMismatch on the first checkpoint that differs if strict, otherwise returns all of them.
+        Also prints how long it took, like run_headless(). """
+    init_headless()
+    recording = Recording.load(path)
+
+    if scene_class is None:
+        # After init_headless(), see headless.py
+        from game import GameScene
+        scene_class = GameScene
+
+    scene = scene_class()
+    scene.start()
+    player = scene.player_one
+    checkpoints = dict((checkpoint[0], checkpoint) for checkpoint in recording.checkpoints)
+    mismatches = []
+
+    start = time.perf_counter()
+    for step in play_recording(scene, recording):
+        expected = checkpoints.get(step)
+        if expected is not None:
+            actual = player_checkpoint(step, player)
+            if actual != expected:
+                mismatch = "step %d: expected %s, got %s" % (step, describe(expected), describe(actual))
+                if strict:
+                    raise ReplayMismatch(mismatch)
+                mismatches.append(mismatch)
+    run_time = time.perf_counter() - start
+
+    flush_log()
+    print("Replayed %d steps in %.3fs (%.0f steps per second), %d of %d checkpoints matched"
+          % (recording.steps, run_time, recording.steps / run_time if run_time else float('inf'),
+             len(checkpoints) - len(mismatches), len(checkpoints)))
+    return mismatches
+
+
+def describe(checkpoint):
+    _, x, y, x_speed, y_speed, ground_speed, ground, state = checkpoint
+    return "x,y %r,%r speed %r,%r ground speed %r %s %s" % (
+        x, y, x_speed, y_speed, ground_speed, "grounded" if ground else "airborne", STATES[state])
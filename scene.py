@@ -5,18 +5,42 @@
 #	self.change_scene(ChildScene())
 # -------------------------------------------------------------------- #
 
+from log import get_logger
+
+log = get_logger("scene")
+
 class Scene:
     def __init__(self):
         self.next = self
 
+        # Set when everything has to be drawn again next frame (first frame, window uncovered...), see draw()
+        self.redraw_all = True
+
     def events(self, events, pressed_keys):
-        print("uh-oh, you didn't override this in the child class")
+        log.warning("uh-oh, %s didn't override events()", type(self).__name__)
 
     def update(self, clock_tick):
-        print("uh-oh, you didn't override this in the child class")
+        log.warning("uh-oh, %s didn't override update()", type(self).__name__)
+
+    # Draw straight onto the display surface, and return the list of rects that changed,
+    # or None if all of it did. An empty list means there's nothing new to show.
+    def draw(self, screen):
+        log.warning("uh-oh, %s didn't override draw()", type(self).__name__)
+
+    # Called once the frame is scaled up to the window, to draw things at the window's resolution
+    # (debug text...) on top of it, see display.py. Returns True if it drew anything.
+    def draw_overlay(self, window, display):
+        return False
+
+    # Called before draw() with how far (0 to 1) the frame is into the next physics step,
+    # so scenes can draw things between their last two positions. Optional to override.
+    def interpolate(self, alpha):
+        pass
 
-    def draw(self, screen, surface):
-        print("uh-oh, you didn't override this in the child class")
+    # Called on the main thread when the scene becomes the active one, before its first events().
+    # Scenes may be built on another thread (see scene_loader.py), so anything touching the window goes here.
+    def start(self):
+        pass
 
     def change_scene(self, next_scene):
         self.next = next_scene
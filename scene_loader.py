@@ -0,0 +1,125 @@
+# -------------------------------------------------------------------- #
+# scene_loader.py
+#   builds the next scene on a background thread while the current one
+#   keeps running, so switching to it doesn't freeze the window.
+#   Scenes that take a progress argument get told how far along they are.
+#
+#   self.loader = SceneLoader(GameScene)
+#   ...
+#   if self.loader.done:
+#       self.change_scene(self.loader.get())
+#   else:
+#       self.change_scene(LoadingScene(self.loader))
+# -------------------------------------------------------------------- #
+
+# General imports:
+import threading
+
+# Game library imports:
+import pygame
+
+# Local imports:
+from constants import *
+from scene import Scene
+from text_cache import render_text
+
+
+class SceneLoader(object):
+    """ Builds scene_class(*args, progress=..., **kwargs) on a worker thread.
+        scene_class can also be a function returning the scene, like title.load_game_scene. """
+
+    def __init__(self, scene_class, *args, **kwargs):
+        self.scene_class = scene_class
+        self.args = args
+        self.kwargs = kwargs
+
+        # How far along loading is, from 0 to 1, and what it's doing right now
+        self.progress = 0.0
+        self.stage = "Starting"
+
+        self.scene = None
+        self.error = None
+        self.finished = threading.Event()
+
+        self.thread = threading.Thread(target=self.run, name="scene loader", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        try:
+            self.scene = self.scene_class(*self.args, progress=self.report, **self.kwargs)
+            self.report(1.0, "Done")
+        except Exception as error:
+            # Handed over to the main thread by get()
+            self.error = error
+        finally:
+            self.finished.set()
+
+    def report(self, progress, stage):
+        """ Called by the scene being built, from the worker thread. """
+        self.progress, self.stage = progress, stage
+
+    @property
+    def done(self):
+        return self.finished.is_set()
+
+    def get(self):
+        """ Return the loaded scene, waiting for it if needed. Errors raised while loading are raised here. """
+        self.finished.wait()
+        if self.error is not None:
+            raise self.error
+        return self.scene
+
+
+# Space above the progress bar for the stage text
+PROGRESS_TEXT_HEIGHT = 30
+
+# Where the title and loading screens show the progress bar
+PROGRESS_BAR_RECT = pygame.Rect(16, SCREEN_HEIGHT - 24, SCREEN_WIDTH - 32, 8)
+
+
+def draw_progress(surface, loader, rect):
+    """ Draw a loader's progress as a bar, with what it's doing above it. """
+    rect = pygame.Rect(rect)
+    pygame.draw.rect(surface, WHITE, rect, 1)
+    fill = rect.inflate(-4, -4)
+    fill.width = int(fill.width * loader.progress)
+    pygame.draw.rect(surface, WHITE, fill)
+    stage_text = render_text(HUD_FONT, 20, loader.stage, WHITE)
+    surface.blit(stage_text, (rect.x, rect.y - stage_text.get_height() - 4))
+
+
+def progress_area(rect):
+    """ The part of the screen draw_progress() draws on, stage text included. """
+    rect = pygame.Rect(rect)
+    return pygame.Rect(rect.x, rect.y - PROGRESS_TEXT_HEIGHT, rect.width, rect.height + PROGRESS_TEXT_HEIGHT)
+
+
+class LoadingScene(Scene):
+    """ Shown when the next scene was asked for before it finished loading, switches to it once it's ready. """
+
+    def __init__(self, loader):
+        Scene.__init__(self)
+        self.loader = loader
+        self.drawn_progress = None
+
+    def events(self, events, pressed_keys):
+        pass
+
+    def update(self, clock_tick):
+        if self.loader.done:
+            self.change_scene(self.loader.get())
+
+    def draw(self, screen):
+        # Only the progress bar changes
+        progress = (self.loader.progress, self.loader.stage)
+        if not self.redraw_all and progress == self.drawn_progress:
+            return []
+
+        screen.fill(TITLE_BG_COLOR)
+        screen.blit(render_text(TITLE_FONT, 24, 'Loading...', WHITE), (16, 16))
+        draw_progress(screen, self.loader, PROGRESS_BAR_RECT)
+
+        dirty_rects = None if self.redraw_all else [progress_area(PROGRESS_BAR_RECT)]
+        self.redraw_all = False
+        self.drawn_progress = progress
+        return dirty_rects
@@ -1,9 +1,32 @@
+import numpy as np
 import pygame
 
 # local imports
+from angles import MODE_FLOOR
 from constants import *
 
-# TODO: I have some old code commented out, which I will delete when I'm sure I don't need it.
+# Which way each kind of sensor looks in floor mode, as (axis, sign).
+# Axis 0 is horizontal and axis 1 is vertical, a positive sign points right/down.
+SENSOR_DIRECTIONS = {
+    SENSOR_LEFT_FLOOR: (1, 1),
+    SENSOR_RIGHT_FLOOR: (1, 1),
+    SENSOR_LEFT_WALL: (0, -1),
+    SENSOR_RIGHT_WALL: (0, 1),
+}
+
+# Fewer sensors than this are cast one at a time, setting up the arrays for a vectorized
+# cast costs more than it saves until there are about this many of them (a player has 4)
+VECTOR_CAST_MIN_SENSORS = 128
+
+
+def rotate_layout(relative_position, axis, sign, size):
+    """ A sensor's position in the player's rect and direction, turned a quarter turn counter-clockwise
+        around the center of the rect, like the player is when going from one sensor mode to the next. """
+    x, y = relative_position
+    width, height = size
+    # Pointing right becomes pointing up, pointing down becomes pointing right
+    axis, sign = 1 - axis, -sign if axis == 0 else sign
+    return [(width - height) // 2 + y, (width + height) // 2 - 1 - x], axis, sign
 
 class Sensor(pygame.sprite.Sprite):
     def __init__(self, player_rect, relative_position, sensor_state, inactive_color=GRAY, active_color=WHITE):
@@ -13,12 +36,28 @@ class Sensor(pygame.sprite.Sprite):
         # Sensor is active when it detects collision with a solid object
         self.activated = False
 
+        # Distance to the surface found by the last detect_sensors(), or None
+        self.distance = None
+
+        # Angle of the tile that surface belongs to, in steps of angles.py, see collision_grid.py
+        self.angle = 0
+
         # State keeps track of whether it's a floor, wall, or ceiling sensor
         self.state = sensor_state
 
-        # Sensor's x/y determined via offset of player's x/y 
+        # Sensor's x/y determined via offset of player's x/y
         self.relative_position = relative_position
 
+        # http://info.sonicretro.org/SPG:Slope_Physics#Sensor_Modes
+        # The position and direction in each sensor mode, the floor mode's turned around the player's center.
+        # Floor sensors look for walls and ceilings in the other modes, wall sensors follow them around.
+        self.layouts = [(relative_position,) + SENSOR_DIRECTIONS[sensor_state]]
+        while len(self.layouts) < 4:
+            self.layouts.append(rotate_layout(*self.layouts[-1], size=player_rect.size))
+
+        # Which way it looks in the current sensor mode, see update()
+        self.axis, self.sign = SENSOR_DIRECTIONS[sensor_state]
+
         # Local variables to make self.rect definition more human-readable,
         # although these aren't really necessary:
         relative_x = self.relative_position[0]
@@ -34,52 +73,38 @@ class Sensor(pygame.sprite.Sprite):
         self.active_color = active_color
         self.inactive_color = inactive_color
 
-        # Image allows us to create a collision mask with pygame
-        self.image = pygame.Surface([self.rect.width, self.rect.height])
-
-        # Mask colors help us generate the collision mask
-        self.image.fill(MASK_COLOR)
-        self.image.set_colorkey(MASK_BG_COLOR)
-
-        # And here's out collision mask!
-        self.mask = pygame.mask.from_surface(self.image)
-
-    # Sensors require the player's rectangle in order to update their positions
-    def update(self, player_rect):
+    # Sensors require the player's rectangle in order to update their positions,
+    # and the sensor mode (see angles.py) to know which way to look
+    def update(self, player_rect, mode=MODE_FLOOR):
+        self.relative_position, self.axis, self.sign = self.layouts[mode]
         # align sensors relative to player position
         self.rect.x = player_rect.x + self.relative_position[0]
         self.rect.y = player_rect.y + self.relative_position[1]
 
-    """http://info.sonicretro.org/SPG:Solid_Tiles#Height_Masks
-    If the height value found is 16px ($10), that's the entire tile filled at that X position, so 
-    then the sensor has to check for another tile above the first one found, 
-    and search for that one's height value. """
-    def collide(self, platform):
-        collision_coordinates = pygame.sprite.collide_mask(platform, self)
-        if collision_coordinates:  # If collision happened
-            # http://info.sonicretro.org/SPG:Solid_Tiles#Height_Masks
-            absolute_collision = (platform.rect.x + collision_coordinates[0], platform.rect.y + collision_coordinates[1])
-            height = self.rect.bottom - absolute_collision[1]
-            return True, height
-        return False, None
-
-    # TODO: function should detect platforms nearby, not just ones directly collided with.
-    def detect_plaforms(self, platforms):
-
-        # What's the best way to check only the adjacent tiles to the sensor?
-        # We want to avoid checking every tile on the map because that's a waste of processing
-
-        height = 0
-        collision_count = 0
-        for platform in platforms:
-            collided, new_height = self.collide(platform)
-            if collided:
-                collision_count += 1
-                self.activated = True
-                # http://info.sonicretro.org/SPG:Solid_Tiles#Reaction
-                # Once a tile has been found, it's 'height' (or position horizontally for horizontal sensors)
-                # will be returned for Sonic to use to re-position himself.
-                height = new_height
-        if collision_count == 0:
-            self.activated = False
-        return height
+
+def detect_sensors(sensors, collision_grid):
+    """ http://info.sonicretro.org/SPG:Solid_Tiles#Reaction
+        Find the distance to the nearest solid surface of the level's CollisionGrid for each sensor,
+        of any number of actors, for them to re-position themselves with. Sensors that found nothing
+        are left with a distance of None. """
+    count = len(sensors)
+    if count < VECTOR_CAST_MIN_SENSORS:
+        cast = collision_grid.cast_one
+        for sensor in sensors:
+            distance, activated, sensor.angle = cast(sensor.rect.x, sensor.rect.y, sensor.axis, sensor.sign)
+            sensor.activated = activated
+            sensor.distance = distance if activated else None
+        return
+
+    # Enough of them to be worth resolving in one vectorized call
+    x = np.fromiter((sensor.rect.x for sensor in sensors), np.int64, count)
+    y = np.fromiter((sensor.rect.y for sensor in sensors), np.int64, count)
+    axis = np.fromiter((sensor.axis for sensor in sensors), np.int64, count)
+    sign = np.fromiter((sensor.sign for sensor in sensors), np.int64, count)
+
+    distances, found, angles = collision_grid.cast(x, y, axis, sign)
+    for sensor, distance, activated, angle in zip(sensors, distances.tolist(), found.tolist(), angles.tolist()):
+        sensor.activated = activated
+        sensor.distance = distance if activated else None
+        sensor.angle = angle
+
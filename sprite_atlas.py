@@ -0,0 +1,122 @@
+# -------------------------------------------------------------------- #
+# sprite_atlas.py
+#   loads a character's animations from an animation file (JSON), and
+#   hands out their frames, mirrored and rotated ones included.
+#   Mirrored and rotated frames are made the first time they're asked
+#   for and kept after that. Atlases are shared, so every character
+#   using the same animation file uses the same frames.
+#
+#   atlas = load_atlas(CHARACTER_ANIMATIONS)
+#   image = atlas.get_frame(WALKING_STATE, 3, flipped=True, angle=45)
+# -------------------------------------------------------------------- #
+
+# General imports:
+import json
+import os
+import threading
+
+# Game library imports:
+import pygame
+
+# Local imports:
+from constants import *
+from spritesheet import SpriteSheet
+
+# Animation file path -> SpriteAtlas
+atlases = {}
+
+# Atlases can be loaded from the scene loader's thread, see scene_loader.py
+atlases_lock = threading.Lock()
+
+
+def load_atlas(path):
+    """ Return the atlas of an animation file, loading it the first time. """
+    with atlases_lock:
+        atlas = atlases.get(path)
+        if atlas is None:
+            atlas = atlases[path] = SpriteAtlas(path)
+        return atlas
+
+
+class SpriteAtlas(object):
+    """ All frames of a character's animations.
+
+        The animation file names the sprite sheet (relative to the file), the frame size,
+        the spacing between frames and the colorkey. Each animation is either a row of frames
+        on the sheet ({"start": [x, y], "frames": count}), or the name of another animation to reuse. """
+
+    def __init__(self, path, rotation_steps=ROTATION_STEPS):
+        with open(path) as f:
+            data = json.load(f)
+
+        self.path = path
+        self.rotation_steps = rotation_steps
+        self.frame_width, self.frame_height = data['frame_size']
+        self.colorkey = tuple(data.get('colorkey', BLACK))
+
+        self.sheet = SpriteSheet(os.path.join(os.path.dirname(path), data['sheet'])).sprite_sheet
+        spacing = data.get('spacing', 0)
+
+        # Animation name -> list of frames, as they are on the sheet
+        self.animations = {}
+        # Animation name -> name of the animation whose frames it reuses
+        self.aliases = {}
+        for name, animation in data['animations'].items():
+            if isinstance(animation, str):
+                self.aliases[name] = animation
+                continue
+            x, y = animation['start']
+            self.animations[name] = [
+                self.get_sheet_frame(x + i * (self.frame_width + spacing), y)
+                for i in range(animation['frames'])]
+
+        # (animation name, frame index, flipped, rotation step) -> frame, see get_frame()
+        self.frames = {}
+
+    def get_sheet_frame(self, x, y):
+        # Frames share their pixels with the sheet instead of being copied out of it
+        frame = self.sheet.subsurface((x, y, self.frame_width, self.frame_height))
+        frame.set_colorkey(self.colorkey)
+        return frame
+
+    def frame_count(self, name):
+        return len(self.animations[self.aliases.get(name, name)])
+
+    def rotation_step(self, angle):
+        """ Return the nearest rotation step of an angle in degrees. """
+        return int(round(angle * self.rotation_steps / 360.0)) % self.rotation_steps
+
+    def get_frame(self, name, index, flipped=False, angle=0):
+        """ Return a frame of an animation, mirrored horizontally if flipped,
+            and rotated counter-clockwise by angle degrees (rounded to the nearest rotation step). """
+        name = self.aliases.get(name, name)
+        step = self.rotation_step(angle)
+        key = (name, index, flipped, step)
+        frame = self.frames.get(key)
+        if frame is None:
+            frame = self.frames[key] = self.make_frame(name, index, flipped, step)
+        return frame
+
+    def make_frame(self, name, index, flipped, step):
+        frame = self.animations[name][index]
+        if flipped:
+            frame = pygame.transform.flip(frame, True, False)
+            frame.set_colorkey(self.colorkey)
+        if step:
+            # Rotating makes the image bigger, the frame keeps its size and is rotated around its center,
+            # so rotated frames line up with the player's rect like the others
+            rotated = pygame.transform.rotate(frame, step * 360.0 / self.rotation_steps)
+            frame = pygame.Surface((self.frame_width, self.frame_height), 0, frame)
+            frame.fill(self.colorkey)
+            frame.blit(rotated, ((self.frame_width - rotated.get_width()) // 2,
+                                 (self.frame_height - rotated.get_height()) // 2))
+            frame.set_colorkey(self.colorkey)
+        return frame
+
+    def prebuild(self, flipped=(False, True)):
+        """ Make every mirrored and rotated frame now, so none get made while playing. """
+        for name, frames in self.animations.items():
+            for index in range(len(frames)):
+                for flip in flipped:
+                    for step in range(self.rotation_steps):
+                        self.get_frame(name, index, flip, step * 360.0 / self.rotation_steps)
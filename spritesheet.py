@@ -16,8 +16,10 @@ class SpriteSheet(object):
     def __init__(self, file_name):
         """ Constructor. Pass in the file name of the sprite sheet. """
 
-        # Load the sprite sheet.
-        self.sprite_sheet = pygame.image.load(file_name).convert()
+        # Load the sprite sheet, converted for fast blits unless running without a window
+        self.sprite_sheet = pygame.image.load(file_name)
+        if pygame.display.get_surface() is not None:
+            self.sprite_sheet = self.sprite_sheet.convert()
 
     def get_image(self, x, y, width, height):
         """ Grab a single image out of a larger spritesheet
@@ -25,7 +27,7 @@ class SpriteSheet(object):
             and the width and height of the sprite. """
 
         # Create a new blank image
-        image = pygame.Surface([width, height]).convert()
+        image = pygame.Surface([width, height], 0, self.sprite_sheet)
 
         # Copy the sprite from the large sheet onto the smaller image
         image.blit(self.sprite_sheet, (0, 0), (x, y, width, height))
@@ -0,0 +1,58 @@
+# -------------------------------------------------------------------- #
+# startup.py
+#   times how long the game takes to start, phase by phase, from the
+#   moment main.py starts running to the first frame on screen, and the
+#   modules and scenes loaded in the background after it. Imported first
+#   thing by main.py, so its clock starts before anything else loads.
+#
+#   startup.mark("window")
+#   game = startup.timed_import("game")
+#
+#   python main.py --startup-report
+# -------------------------------------------------------------------- #
+
+# General imports:
+import importlib
+import threading
+import time
+
+start_time = time.perf_counter()
+
+# (name, milliseconds since start_time) of each phase, in the order they finished
+phases = []
+
+# (module name, milliseconds it took to import), see timed_import()
+import_times = []
+
+lock = threading.Lock()
+
+
+def elapsed():
+    return (time.perf_counter() - start_time) * 1000
+
+
+def mark(name):
+    """ Note that a phase of starting up just finished. Can be called from any thread. """
+    with lock:
+        phases.append((name, elapsed()))
+
+
+def timed_import(name):
+    """ Import a module, noting how long it took. Modules already imported take no time. """
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    with lock:
+        import_times.append((name, (time.perf_counter() - start) * 1000))
+    return module
+
+
+def report():
+    """ The phases and imports timed so far, as lines of text. """
+    with lock:
+        lines = ["Startup, in milliseconds since main.py started:"]
+        previous = 0.0
+        for name, at in phases:
+            lines.append("  %-28s %8.1f  (+%.1f)" % (name, at, at - previous))
+            previous = at
+        lines += ["  import %-21s %8.1f" % import_time for import_time in import_times]
+    return lines
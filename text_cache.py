@@ -0,0 +1,49 @@
+# -------------------------------------------------------------------- #
+# text_cache.py
+#   loads each font once, renders static text once, and only
+#   re-renders changing text (like the debug overlay) when it changes
+# -------------------------------------------------------------------- #
+
+# Game library imports:
+import pygame
+
+# (font path, size) -> pygame.font.Font
+fonts = {}
+
+# (font path, size, text, color, antialias) -> rendered Surface
+rendered_text = {}
+
+
+def get_font(path, size):
+    """ Return a font, loading it from disk the first time. """
+    font = fonts.get((path, size))
+    if font is None:
+        font = fonts[(path, size)] = pygame.font.Font(path, size)
+    return font
+
+
+def render_text(path, size, text, color, antialias=False):
+    """ Render a piece of static text once, and hand back the same Surface after that.
+        Use a TextLine instead for text that keeps changing, so it doesn't pile up in here. """
+    key = (path, size, text, tuple(color), antialias)
+    surface = rendered_text.get(key)
+    if surface is None:
+        surface = rendered_text[key] = get_font(path, size).render(text, antialias, color)
+    return surface
+
+
+class TextLine(object):
+    """ A line of text whose Surface is only re-rendered when the text changes. """
+
+    def __init__(self, path, size, color, antialias=False):
+        self.font = get_font(path, size)
+        self.color = color
+        self.antialias = antialias
+        self.text = None
+        self.surface = None
+
+    def render(self, text):
+        if text != self.text:
+            self.text = text
+            self.surface = self.font.render(text, self.antialias, self.color)
+        return self.surface
@@ -1,37 +1,76 @@
 import pygame
 
+import startup
 from constants import *
-from game import GameScene
 from scene import Scene
+from scene_loader import PROGRESS_BAR_RECT, LoadingScene, SceneLoader, draw_progress, progress_area
+from text_cache import render_text
+
+
+def load_game_scene(progress, recorder=None, renderer=LEVEL_RENDERER):
+    """ Builds the game scene for the SceneLoader. The game's modules (pyscroll, pytmx, the player...)
+        are imported here, on the loader's thread, so the title screen doesn't wait for them. """
+    progress(0.0, "Loading modules")
+    game = startup.timed_import("game")
+    scene = game.GameScene(progress, recorder, renderer=renderer)
+    startup.mark("game scene loaded")
+    return scene
 
 
 class TitleScene(Scene):
-    def __init__(self, ):
+    # recorder is handed to the game scene, see replay.py, and so is the level renderer, see chunk_renderer.py
+    def __init__(self, recorder=None, renderer=LEVEL_RENDERER):
         Scene.__init__(self)
+        self.recorder = recorder
+        self.renderer = renderer
+
+        # The game scene is loaded in the background while the title screen is up, see scene_loader.py
+        self.loader = None
+
+        # Loading progress last drawn, the screen only changes along with it
+        self.drawn_progress = None
+
+    def start(self):
+        if self.loader is None:
+            self.loader = SceneLoader(load_game_scene, recorder=self.recorder, renderer=self.renderer)
 
     def events(self, events, pressed_keys):
         for event in events:
             if event.type == pygame.KEYDOWN and event.key == pygame.K_RETURN:
-                # Move to the next scene when the user pressed Enter
-                self.change_scene(GameScene())
+                # Move to the next scene when the user pressed Enter,
+                # through a loading screen if it isn't ready yet
+                self.start()
+                if self.loader.done:
+                    self.change_scene(self.loader.get())
+                else:
+                    self.change_scene(LoadingScene(self.loader))
 
     def update(self, clock_tick):
         pass
 
-    def draw(self, screen, surface):
+    def draw(self, screen):
+        # Nothing moves on the title screen but the loading progress bar
+        loading = self.loader is not None and not self.loader.done
+        progress = (self.loader.progress, self.loader.stage) if self.loader is not None else None
+        if not self.redraw_all and progress == self.drawn_progress:
+            return []
+
         # Screen background color
         screen.fill(TITLE_BG_COLOR)
 
-        # Make large font
-        largeTitleFont = pygame.font.Font(TITLE_FONT, 40)
+        # Create instances of text, the fonts and text are only rendered the first time
+        titleText = render_text(TITLE_FONT, 24, 'Platformer Engine Test', WHITE)
+        subtitleText = render_text(TITLE_FONT, 18, 'Press enter to play!', WHITE)
 
-        # Make small font
-        smallTitleFont = pygame.font.Font(TITLE_FONT, 30)
+        # Render the text
+        screen.blit(titleText, (16, 16))
+        screen.blit(subtitleText, (16, SCREEN_HEIGHT // 2))
 
-        # Create instances of text
-        titleText = largeTitleFont.render('Platformer Engine Test', False, WHITE)
-        subtitleText = smallTitleFont.render('Press enter to play!', False, WHITE)
+        # How far the game is from being ready
+        if loading:
+            draw_progress(screen, self.loader, PROGRESS_BAR_RECT)
 
-        # Render the text
-        screen.blit(titleText, (50, 0))
-        screen.blit(subtitleText, (50, 200))
+        dirty_rects = None if self.redraw_all else [progress_area(PROGRESS_BAR_RECT)]
+        self.redraw_all = False
+        self.drawn_progress = progress
+        return dirty_rects